@@ -0,0 +1,91 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class GenerationBatcher:
+    """Collect concurrent generation requests into micro-batches.
+
+    Requests submitted within `max_wait` seconds of the first pending one, up to
+    `max_batch_size` of them, are passed together to `generate_batch`, which must
+    return one result per item in the same order. Each caller gets a Future that
+    resolves to its own result.
+    """
+
+    def __init__(self, generate_batch, max_batch_size=8, max_wait=0.01):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="gpt2-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue an item for generation and return a Future for its result"""
+        future = Future()
+        with self._lock:
+            if not self._closed:
+                self._queue.put((item, future))
+                return future
+
+        # A closed batcher still serves late callers, one item at a time
+        try:
+            future.set_result(self.generate_batch([item])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        """Stop the worker thread once the requests already queued are served"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+
+    def _collect_batch(self):
+        """Block for the first request, then gather more until the window closes or the batch is full.
+
+        Returns the batch and whether the close marker was reached.
+        """
+        batch = []
+        deadline = None
+        closing = False
+
+        while len(batch) < self.max_batch_size:
+            try:
+                if deadline is None:
+                    entry = self._queue.get()
+                    deadline = time.monotonic() + self.max_wait
+                elif deadline > time.monotonic():
+                    entry = self._queue.get(timeout=deadline - time.monotonic())
+                else:
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                closing = True
+                break
+            batch.append(entry)
+
+        # Drop requests whose callers have already given up
+        return [(item, future) for item, future in batch if future.set_running_or_notify_cancel()], closing
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch, closing = self._collect_batch()
+            if not batch:
+                continue
+
+            try:
+                results = self.generate_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
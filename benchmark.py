@@ -0,0 +1,324 @@
+"""Reproducible latency/throughput benchmark for the chatbot.
+
+Replays the categorized `test_prompts` from main.py, plus an optional synthetic
+category backed by a scaled-up FAQ and keyword dataset, either directly against
+ChatbotService or against a running server, and reports throughput,
+p50/p95/p99 latency and the distribution of answering tiers per category.
+
+Examples:
+    python benchmark.py --model stub --scale 20000 --concurrency 8 --output bench.json
+    python benchmark.py --target app --url http://localhost:8000 --concurrency 16
+    python benchmark.py --model stub --baseline bench.json --max-regression 0.2
+"""
+import os
+import re
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from chatbot_service import ChatbotService
+from main import test_prompts
+
+# Settings that don't change what is measured, so runs differing only in them can be compared
+UNMEASURED_SETTINGS = {"baseline", "output", "max_regression", "min_regression_ms", "metrics_wait"}
+
+
+class StubChatbotService(ChatbotService):
+    """ChatbotService whose GPT-2 tier returns a fixed answer after a fixed delay.
+
+    Keeps benchmarks deterministic and runnable offline while still exercising
+    the routing tiers, the batcher and the cache exactly as in production.
+    """
+
+    def __init__(self, data, generation_latency=0.05, **kwargs):
+        self.generation_latency = generation_latency
+        super().__init__(None, data, **kwargs)
+
+    @property
+    def gpt2_ready(self):
+        return True
+
+    def _generate_gpt2_batch(self, user_inputs):
+        time.sleep(self.generation_latency)
+        return ["SM Technology can help you with that. Please contact our sales team."] * len(user_inputs)
+
+
+def build_synthetic_dataset(data, scale, seed):
+    """Return a copy of the dataset with `scale` extra FAQ entries and keywords, plus prompts hitting them"""
+    rng = random.Random(seed)
+    data = copy.deepcopy(data)
+    codes = [f"zx{idx:05d}" for idx in range(scale)]
+
+    for code in codes:
+        data["faq"].append({
+            "question": f"What is the support policy for plan {code}?",
+            "answer": f"Plan {code} includes standard support during business hours."
+        })
+        data["tech_stack"].append(f"Framework{code}")
+
+    prompts = []
+    for code in rng.sample(codes, min(len(codes), 50)):
+        prompts.append(rng.choice([
+            f"What is the support policy for plan {code}?",
+            f"support policy for plan {code}",
+            f"Do you work with Framework{code}?",
+            f"Tell me something about plan {code} pricing tiers"
+        ]))
+    return data, prompts
+
+
+def build_service(args, data):
+    """Create the ChatbotService for the chosen model mode"""
+    kwargs = {"max_batch_size": args.batch_size, "batch_wait": args.batch_wait_ms / 1000}
+    if args.cache_size > 0:
+        from response_cache import ResponseCache
+        kwargs["response_cache"] = ResponseCache(max_size=args.cache_size)
+
+    if args.model == "stub":
+        return StubChatbotService(data, generation_latency=args.stub_latency, **kwargs)
+
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel, GPT2Tokenizer
+
+    torch.manual_seed(args.seed)
+    tokenizer = GPT2Tokenizer.from_pretrained(args.tokenizer)
+    if args.model == "tiny":
+        # Randomly initialized but seeded, so runs are comparable; the long
+        # position table leaves room for a context grown by --scale
+        config = GPT2Config(vocab_size=len(tokenizer), n_layer=2, n_head=2, n_embd=128, n_positions=8192)
+        model = GPT2LMHeadModel(config)
+    else:
+        model = GPT2LMHeadModel.from_pretrained("gpt2")
+    model.eval()
+    if args.inference_mode == "int8":
+        from quantization import quantize_model
+        model = quantize_model(model)
+
+    service = ChatbotService(None, data, **kwargs)
+    service.attach_model(model, tokenizer)
+    return service
+
+
+def percentile(sorted_values, q):
+    """Linearly interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies, elapsed, tiers):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else None,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000 if latencies else None,
+            "p50": percentile(latencies, 0.50) * 1000 if latencies else None,
+            "p95": percentile(latencies, 0.95) * 1000 if latencies else None,
+            "p99": percentile(latencies, 0.99) * 1000 if latencies else None,
+            "max": latencies[-1] * 1000 if latencies else None
+        },
+        "tiers": dict(tiers) if tiers is not None else None
+    }
+
+
+def run_prompts(prompts, answer, concurrency):
+    """Answer every prompt with `concurrency` threads; returns (latencies, elapsed, tiers)"""
+    latencies = []
+    tiers = Counter()
+    lock = threading.Lock()
+
+    def timed(prompt):
+        start = time.perf_counter()
+        tier = answer(prompt)
+        latency = time.perf_counter() - start
+        with lock:
+            latencies.append(latency)
+            if tier:
+                tiers[tier] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, prompts))
+    return latencies, time.perf_counter() - start, tiers
+
+
+def service_answerer(service):
+    def answer(prompt):
+        tier, _ = service.route_fast(prompt)
+        if tier is None:
+            service.get_gpt2_response(prompt)
+            tier = "gpt2"
+        return tier
+    return answer
+
+
+def app_answerer(url):
+    import requests
+
+    session = requests.Session()
+
+    def answer(prompt):
+        session.post(f"{url}/chat", json={"message": prompt}, timeout=120).raise_for_status()
+    return answer
+
+
+def read_tier_hits(url):
+    """Read the per-tier hit counters from the server's /metrics endpoint"""
+    import requests
+
+    text = requests.get(f"{url}/metrics", timeout=10).text
+    return Counter({
+        tier: float(value)
+        for tier, value in re.findall(r'^chatbot_tier_hits_total\{tier="([^"]+)"\} (\S+)$', text, re.M)
+    })
+
+
+def config_mismatches(config, baseline_config):
+    """Return the settings that differ between two runs, ignoring those that don't affect the measurements"""
+    keys = (set(config) | set(baseline_config)) - UNMEASURED_SETTINGS
+    return sorted(key for key in keys if config.get(key) != baseline_config.get(key))
+
+
+def compare(results, baseline, max_regression, min_regression_ms):
+    """Print p95 changes against a baseline run; returns the regressed categories.
+
+    A category regresses when its p95 grows by more than `max_regression` and
+    by more than `min_regression_ms`, so sub-millisecond noise in the fast
+    tiers never fails a run.
+    """
+    regressions = []
+    for category, current in results["categories"].items():
+        previous = baseline.get("categories", {}).get(category)
+        if not previous or not previous["latency_ms"]["p95"] or not current["latency_ms"]["p95"]:
+            continue
+        change = current["latency_ms"]["p95"] / previous["latency_ms"]["p95"] - 1
+        print(f"{category:20s} p95 {previous['latency_ms']['p95']:9.2f} -> {current['latency_ms']['p95']:9.2f} ms ({change:+.1%})")
+        if change > max_regression and current["latency_ms"]["p95"] - previous["latency_ms"]["p95"] > min_regression_ms:
+            regressions.append(category)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chatbot on the test_prompts corpus")
+    parser.add_argument("--target", choices=["service", "app"], default="service",
+                        help="call ChatbotService in-process or a running server over HTTP")
+    parser.add_argument("--url", default="http://localhost:8000", help="server URL for --target app")
+    parser.add_argument("--metrics-wait", type=float, default=2.0,
+                        help="seconds to wait before reading /metrics for --target app; must exceed the "
+                             "server's METRICS_EXPORT_INTERVAL, as pre-fork workers export their counts that often")
+    parser.add_argument("--model", choices=["stub", "tiny", "gpt2"], default="stub",
+                        help="GPT-2 tier for --target service: fixed-latency stub, seeded tiny random model or real GPT-2")
+    parser.add_argument("--inference-mode", choices=["fp32", "int8"], default="fp32",
+                        help="GPT-2 weights for --model tiny/gpt2, see quantization.py")
+    parser.add_argument("--tokenizer", default="gpt2", help="tokenizer name or path for --model tiny/gpt2")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="seconds per stub generation batch")
+    parser.add_argument("--dataset", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset.json"))
+    parser.add_argument("--scale", type=int, default=0,
+                        help="synthetic FAQ entries and keywords to add (service target only; grows the GPT-2 context too)")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=10, help="times each prompt is replayed")
+    parser.add_argument("--batch-size", type=int, default=8, help="GPT-2 micro-batch size")
+    parser.add_argument("--batch-wait-ms", type=float, default=10)
+    parser.add_argument("--cache-size", type=int, default=0, help="response cache size, 0 to benchmark without it")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="exit with status 1 if any category's p95 grows by more than this fraction")
+    parser.add_argument("--min-regression-ms", type=float, default=1.0,
+                        help="ignore p95 growth smaller than this many milliseconds")
+    args = parser.parse_args()
+
+    # Only runs with the same settings are comparable
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        config = {key: value for key, value in vars(args).items() if key not in UNMEASURED_SETTINGS}
+        mismatches = config_mismatches(config, baseline.get("config", {}))
+        if mismatches:
+            parser.error(f"baseline {args.baseline} was run with different settings: {', '.join(mismatches)}")
+
+    with open(args.dataset, "r") as f:
+        data = json.load(f)
+
+    categories = dict(test_prompts)
+    if args.scale > 0:
+        data, synthetic_prompts = build_synthetic_dataset(data, args.scale, args.seed)
+        categories["synthetic"] = synthetic_prompts
+
+    if args.target == "service":
+        service = build_service(args, data)
+        answer = service_answerer(service)
+    else:
+        answer = app_answerer(args.url)
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key not in UNMEASURED_SETTINGS},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "categories": {}
+    }
+
+    # Over HTTP the answering tier comes from the server's counters. Pre-fork
+    # workers export theirs every METRICS_EXPORT_INTERVAL, so each read waits
+    # until every count of the previous category has been exported
+    hits = None
+    if args.target == "app":
+        time.sleep(args.metrics_wait)
+        hits = read_tier_hits(args.url)
+
+    all_latencies = []
+    all_tiers = Counter()
+    total_elapsed = 0.0
+    for category, prompts in categories.items():
+        replay = [prompt for _ in range(args.repeat) for prompt in prompts]
+        latencies, elapsed, tiers = run_prompts(replay, answer, args.concurrency)
+
+        # Categories run one after another, so the difference belongs to this category
+        if args.target == "app":
+            hits_before = hits
+            time.sleep(args.metrics_wait)
+            hits = read_tier_hits(args.url)
+            tiers = hits.copy()
+            tiers.subtract(hits_before)
+            tiers = Counter({tier: int(count) for tier, count in tiers.items() if count > 0})
+
+        results["categories"][category] = summarize(latencies, elapsed, tiers)
+        all_latencies.extend(latencies)
+        all_tiers.update(tiers)
+        total_elapsed += elapsed
+
+        summary = results["categories"][category]
+        print(f"{category:20s} {summary['throughput_rps']:9.1f} req/s  "
+              f"p50 {summary['latency_ms']['p50']:8.2f} ms  p95 {summary['latency_ms']['p95']:8.2f} ms  "
+              f"p99 {summary['latency_ms']['p99']:8.2f} ms  {dict(tiers)}")
+
+    results["overall"] = summarize(all_latencies, total_elapsed, all_tiers)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.max_regression, args.min_regression_ms)
+        if regressions:
+            print(f"p95 regressed by more than {args.max_regression:.0%} and {args.min_regression_ms:g} ms "
+                  f"in: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
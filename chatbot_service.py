@@ -1,17 +1,329 @@
 import re
+import copy
 import json
+import time
+import queue
+import threading
 import torch
-from transformers import GPT2Tokenizer
+from collections import deque
+from concurrent.futures import Future
+from transformers import GPT2Tokenizer, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+from batching import GenerationBatcher
+from metrics import Metrics
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+# Patterns used to detect questions about a person, in priority order
+PERSON_PATTERNS = [
+    r"who is (\w+\s*\w*)",
+    r"tell me about (\w+\s*\w*)",
+    r"who('s| is) (\w+\s*\w*)",
+    r"what do you know about (\w+\s*\w*)"
+]
+
+# Topics outside the scope of the dataset
+IRRELEVANT_TOPICS = [
+    "weather", "stock", "sport", "game", "movie", "music", "food", "restaurant",
+    "hotel", "flight", "train", "bus", "car", "bike", "book", "novel",
+    "news", "politics", "election", "president", "prime minister", "police", "crime",
+    "accident", "health", "doctor", "hospital", "medicine", "covid", "virus",
+    "vaccine", "investment", "bitcoin", "crypto", "blockchain"
+]
+
+# Personal questions directed at the chatbot itself
+PERSONAL_PATTERNS = [
+    r"(how are|how're|how do) you",
+    r"what('s| is) your name",
+    r"who are you",
+    r"tell me about yourself",
+    r"where are you",
+    r"how old are you",
+    r"what do you (like|love|enjoy|prefer)",
+    r"your (favorite|favourite)"
+]
+
+# Filter out nonsensical or fabricated responses
+RED_FLAGS = [
+    "I am", "I have", "My name", "I'm a", "I work", "I don't",
+    "BDD", "blog post", "years", "fan",
+    "The CEO is the CEO", "The Chairman is the Chairman",
+    "MD.", "Mr.", "Dr."  # Be cautious with titles not in our dataset
+]
+
+# Flags that are part of a known name never reject an answer
+KNOWN_PERSON_NAMES = ["MD. Monir Hossain", "MD. Shamim Miah", "MD. Jabed", "MST. Sabina Akter"]
+ACTIVE_RED_FLAGS = [
+    flag for flag in RED_FLAGS
+    if not any(flag in person for person in KNOWN_PERSON_NAMES)
+]
+
+# Streamed text that could still grow into one of these is held back until it can't
+STREAM_HELD_PREFIXES = ACTIVE_RED_FLAGS + ["Answer:"]
+STREAM_HOLDBACK = max(len(prefix) for prefix in STREAM_HELD_PREFIXES)
+
+# Bounds for a reasonable answer length
+MIN_ANSWER_LENGTH = 10
+MAX_ANSWER_LENGTH = 200
+
+# Dataset sections that the keyword tables and the GPT-2 context are built from
+KEYWORD_SECTIONS = {"company", "services", "tech_stack"}
+CONTEXT_SECTIONS = {"company", "services", "pricing", "tech_stack"}
+
+# Sampling settings shared by every GPT-2 generate call
+GENERATION_KWARGS = {
+    "max_new_tokens": 100,
+    "num_return_sequences": 1,
+    "temperature": 0.3,
+    "do_sample": True,
+    "top_k": 30,
+    "top_p": 0.9,
+    "no_repeat_ngram_size": 2
+}
+
+
+def _run_into_future(future, fn):
+    """Run fn on the current thread and store its outcome in future"""
+    try:
+        future.set_result(fn())
+    except Exception as e:
+        future.set_exception(e)
+
+
+class GenerationTimer(StoppingCriteria):
+    """Record when generate produces its first and latest tokens; never stops generation.
+
+    The time to the first token covers the prompt prefill plus one sampling
+    step; everything after it is decoding.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.last_token = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+        self.last_token = now
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+class AnswerStoppingCriteria(StoppingCriteria):
+    """Stop generating a row as soon as the fate of its answer is decided.
+
+    The partially decoded answer is checked after every step with the same
+    rules _extract_answer applies afterwards: generation stops once the answer
+    line is complete, once it is already too long or once it contains a red
+    flag. Text only ever grows, so a row stopped for being too long or for a
+    red flag is rejected exactly as it would have been after a full generation.
+    """
+
+    def __init__(self, tokenizer, prompt_length):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        finished = [
+            self._is_finished(self.tokenizer.decode(row[self.prompt_length:], skip_special_tokens=True))
+            for row in input_ids
+        ]
+        return torch.tensor(finished, dtype=torch.bool, device=input_ids.device)
+
+    def _is_finished(self, answer_text):
+        # A second "Answer:" also ends the answer, as the text is split on it
+        if "Answer:" in answer_text:
+            return True
+        
+        answer = answer_text.lstrip()
+        if "\n" in answer:
+            return True
+        
+        # Trailing whitespace may still be stripped, everything before it is final
+        answer = answer.rstrip()
+        if len(answer) > MAX_ANSWER_LENGTH:
+            return True
+        
+        return any(flag in answer for flag in ACTIVE_RED_FLAGS)
+
+
+class PriorityMatcher:
+    """Match a list of regex patterns against a text in a single scan.
+
+    Patterns are combined into one compiled alternation inside a lookahead, so
+    every position of the text is tested once. The match of the pattern with
+    the lowest index wins, which gives the same result as trying each pattern
+    with re.search in list order.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        alternation = "|".join(f"(?P<p{idx}>{pattern})" for idx, pattern in enumerate(patterns))
+        self._scanner = re.compile(f"(?=(?:{alternation}))")
+
+    def search(self, text):
+        """Return (index, match) of the highest-priority pattern found, or (-1, None)"""
+        best_idx = -1
+        best_pos = -1
+        for match in self._scanner.finditer(text):
+            idx = int(match.lastgroup[1:])
+            if best_idx < 0 or idx < best_idx:
+                best_idx = idx
+                best_pos = match.start()
+                if idx == 0:
+                    break
+
+        if best_idx < 0:
+            return -1, None
+
+        return best_idx, self.patterns[best_idx].match(text, best_pos)
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over literal keywords.
+
+    The text is scanned once, character by character, whatever the number of
+    keywords. search() returns the lowest index of any keyword contained in the
+    text, the same as testing `keyword in text` for each keyword in list order.
+    """
+
+    def __init__(self, keywords):
+        self.transitions = [{}]
+        self.fail = [0]
+        # Lowest keyword index ending at each state, including via fail links
+        self.best = [-1]
+        
+        for idx, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                next_state = self.transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.best.append(-1)
+                    self.transitions[state][char] = next_state
+                state = next_state
+            if self.best[state] < 0:
+                self.best[state] = idx
+        
+        # Breadth-first, so fail targets are always finished before their users
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.transitions[fallback].get(char, 0)
+                
+                inherited = self.best[self.fail[next_state]]
+                if inherited >= 0 and (self.best[next_state] < 0 or inherited < self.best[next_state]):
+                    self.best[next_state] = inherited
+
+    def search(self, text):
+        """Return the lowest index of a keyword found in the text, or -1"""
+        transitions = self.transitions
+        fail = self.fail
+        best = self.best
+        
+        state = 0
+        best_idx = best[0]
+        for char in text:
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            
+            idx = best[state]
+            if idx >= 0 and (best_idx < 0 or idx < best_idx):
+                best_idx = idx
+                if idx == 0:
+                    break
+        
+        return best_idx
+
 
 class ChatbotService:
-    def __init__(self, model, data):
+    def __init__(self, model, data, tokenizer=None, faq_retriever=None, max_batch_size=1, batch_wait=0.01,
+                 response_cache=None, metrics=None, semantic_cache=None):
         self.model = model
         self.data = data
-        self.tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
-        self.faq_questions = [faq["question"].lower() for faq in data["faq"]]
-        self.faq_answers = [faq["answer"] for faq in data["faq"]]
+        self.faq_retriever = faq_retriever
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        self.metrics = metrics or Metrics()
+        
+        # The model may be attached later with attach_model; until then only
+        # the routing tiers can answer
+        if model is not None and tokenizer is None:
+            tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+        self.tokenizer = tokenizer
+        if self.tokenizer is not None and self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self._build_faq_tables()
         self.context = self._generate_context()
         
+        # Merge concurrent GPT-2 requests into batched generate calls
+        self.batcher = None
+        if max_batch_size > 1:
+            self.batcher = GenerationBatcher(self._generate_gpt2_batch, max_batch_size, batch_wait)
+
+        # Routing tables are built once and scanned in a single pass per request
+        self._build_keyword_tables()
+        self.person_matcher = PriorityMatcher(PERSON_PATTERNS)
+        self.topic_matcher = KeywordAutomaton(IRRELEVANT_TOPICS)
+        self.personal_matcher = PriorityMatcher(PERSONAL_PATTERNS)
+
+    def with_data(self, data):
+        """Return a copy of the service for updated data and the set of changed sections.
+
+        Only the structures derived from changed sections are rebuilt; the rest,
+        along with the model, tokenizer, caches and metrics, is shared with this
+        service; callers give the copy fresh caches when the cached answers depend
+        on the data. The copy is complete before it is returned, so callers can
+        swap it in with one assignment while requests in flight finish on this
+        one. The copy gets its own batcher; close this service's once it is replaced.
+        """
+        changed = {key for key in set(data) | set(self.data) if data.get(key) != self.data.get(key)}
+        if not changed:
+            return self, changed
+        
+        service = copy.copy(self)
+        service.data = data
+        
+        if "faq" in changed:
+            service._build_faq_tables()
+        
+        if changed & KEYWORD_SECTIONS:
+            service._build_keyword_tables()
+        
+        if changed & CONTEXT_SECTIONS:
+            # Also rebuilds the prompt prefix cache
+            service.context = service._generate_context()
+        
+        # The batcher generates through the service it was created for, so the
+        # copy always needs its own; the caller closes this service's one
+        if self.batcher:
+            service.batcher = GenerationBatcher(
+                service._generate_gpt2_batch, self.batcher.max_batch_size, self.batcher.max_wait
+            )
+        
+        return service, changed
+
+    def _build_faq_tables(self):
+        """Build the FAQ question and answer lists and their index"""
+        self.faq_questions = [faq["question"].lower() for faq in self.data["faq"]]
+        self.faq_answers = [faq["answer"] for faq in self.data["faq"]]
+        self._build_faq_index()
+
+    def _build_keyword_tables(self):
+        """Build the keyword responses and their matcher"""
+        keyword_responses = self._build_keyword_responses()
+        self.keyword_responses = list(keyword_responses.values())
+        self.keyword_matcher = KeywordAutomaton(keyword_responses)
+        
     def _generate_context(self):
         """Generate a knowledge context from the data"""
         context = []
@@ -47,24 +359,50 @@ class ChatbotService:
         
         return "\n".join(context)
     
+    def _build_faq_index(self):
+        """Pre-tokenize FAQ questions and build a token to FAQ-id posting list"""
+        self.faq_word_sets = []
+        self.faq_index = {}
+        
+        for idx, question in enumerate(self.faq_questions):
+            words = set(WORD_PATTERN.findall(question))
+            self.faq_word_sets.append(words)
+            for word in words:
+                self.faq_index.setdefault(word, []).append(idx)
+
     def _is_faq_match(self, user_input):
         """Check if the user input matches any FAQ questions"""
         user_input = user_input.lower()
+        words_in_user = set(WORD_PATTERN.findall(user_input))
+        
+        # A score above 0.5 needs more than half of the query words in common, so
+        # any match contains at least one of the rarest (len - needed + 1) words.
+        # Only their posting lists are visited, which skips common words like "what"
+        needed = len(words_in_user) // 2 + 1
+        rarest_words = sorted(words_in_user, key=lambda word: len(self.faq_index.get(word, ())))
+        candidates = set()
+        for word in rarest_words[:len(words_in_user) - needed + 1]:
+            candidates.update(self.faq_index.get(word, ()))
         
         best_match_idx = -1
         best_match_score = 0
         
-        for idx, question in enumerate(self.faq_questions):
-            # Direct match
-            if user_input in question or question in user_input:
-                words_in_user = set(re.findall(r'\b\w+\b', user_input))
-                words_in_question = set(re.findall(r'\b\w+\b', question))
-                common_words = words_in_user.intersection(words_in_question)
-                
-                # Calculate match score based on word overlap
-                score = len(common_words) / max(len(words_in_user), len(words_in_question))
-                
-                if score > best_match_score and score > 0.5:  # Threshold for matching
+        # Visit candidates in FAQ order so ties keep resolving to the first entry
+        for idx in sorted(candidates):
+            words_in_question = self.faq_word_sets[idx]
+            
+            # Questions with twice the query's word count can't score above 0.5
+            if len(words_in_question) >= 2 * len(words_in_user):
+                continue
+            
+            # Calculate match score based on word overlap
+            common_words = words_in_user.intersection(words_in_question)
+            score = len(common_words) / max(len(words_in_user), len(words_in_question))
+            
+            if score > best_match_score and score > 0.5:  # Threshold for matching
+                # Direct match
+                question = self.faq_questions[idx]
+                if user_input in question or question in user_input:
                     best_match_score = score
                     best_match_idx = idx
         
@@ -73,10 +411,8 @@ class ChatbotService:
         
         return None
     
-    def _extract_keyword_based_response(self, user_input):
-        """Extract information based on keywords"""
-        user_input = user_input.lower()
-        
+    def _build_keyword_responses(self):
+        """Build the keyword to response mapping, in matching priority order"""
         # Define keyword mappings
         keyword_responses = {
             "ceo": f"The CEO of {self.data['company']['parent_company_info']['name']} is {self.data['company']['parent_company_info']['ceo']}.",
@@ -107,72 +443,187 @@ class ChatbotService:
             tech_lower = tech.lower()
             keyword_responses[tech_lower] = f"Yes, SM Technology works with {tech} for development."
         
-        # Check for matches
-        for keyword, response in keyword_responses.items():
-            if keyword in user_input:
-                return response
+        return keyword_responses
+
+    def _extract_keyword_based_response(self, user_input):
+        """Extract information based on keywords"""
+        idx = self.keyword_matcher.search(user_input.lower())
+        if idx >= 0:
+            return self.keyword_responses[idx]
         
         return None
         
     def get_response(self, user_input):
         """Generate a response to the user input"""
+        response = self.get_fast_response(user_input)
+        if response:
+            return response
+        
+        return self.get_gpt2_response(user_input)
+
+    def get_fast_response(self, user_input):
+        """Answer from the cache or the cheap routing tiers, or return None if GPT-2 is needed"""
+        _, response = self.route_fast(user_input)
+        return response
+
+    def route_fast(self, user_input):
+        """Answer from the cache or the cheap routing tiers; returns (tier, response) or (None, None)"""
+        tier, response = self.route_lexical(user_input)
+        if tier is None:
+            tier, response = self.route_semantic(user_input)
+        return tier, response
+
+    def route_lexical(self, user_input):
+        """Answer from the cache or the lexical tiers, which never run an embedding model"""
+        if self.response_cache:
+            with self.metrics.timer("chatbot_stage_latency_seconds", stage="cache"):
+                cached = self.response_cache.get(user_input)
+            if cached is not None:
+                self.metrics.inc("chatbot_tier_hits_total", tier=cached[0])
+                return cached
+        
+        return self._record_route(user_input, *self._route_lexical(user_input))
+
+    def route_semantic(self, user_input):
+        """Answer from the embedding-based tiers; returns (tier, response) or (None, None)"""
+        return self._record_route(user_input, *self._route_semantic(user_input))
+
+    @property
+    def has_semantic_tiers(self):
+        return bool(self.faq_retriever or self.semantic_cache)
+
+    def _record_route(self, user_input, tier, response):
+        if response:
+            self.metrics.inc("chatbot_tier_hits_total", tier=tier)
+            if self.response_cache:
+                self.response_cache.put(user_input, response, tier)
+        return tier, response
+
+    def get_responses(self, user_inputs, generation_batch_size=16):
+        """Answer many inputs at once; returns (tier, response) pairs in input order.
+
+        The cheap tiers run over every input first. The inputs left for GPT-2 are
+        then generated together, `generation_batch_size` rows per padded batch,
+        which bounds the memory used by the expanded key/value cache. While GPT-2
+        is not ready, those inputs get the "unavailable" tier instead.
+        """
+        results = [self.route_fast(user_input) for user_input in user_inputs]
+        pending = [idx for idx, (tier, _) in enumerate(results) if tier is None]
+        
+        # Without a model the remaining inputs can't be answered yet
+        if not self.gpt2_ready:
+            for idx in pending:
+                results[idx] = ("unavailable", "The chatbot is still starting up. Please try again in a moment.")
+            return results
+        
+        for start in range(0, len(pending), generation_batch_size):
+            chunk = pending[start:start + generation_batch_size]
+            responses = self.get_gpt2_responses([user_inputs[idx] for idx in chunk])
+            for idx, response in zip(chunk, responses):
+                results[idx] = ("gpt2", response)
+        
+        return results
+
+    def _route_lexical(self, user_input):
+        """Run the lexical routing tiers and return (tier, response), or (None, None)"""
         # Step 1: Check for FAQ matches first (highest priority)
-        faq_response = self._is_faq_match(user_input)
+        with self.metrics.timer("chatbot_stage_latency_seconds", stage="faq"):
+            faq_response = self._is_faq_match(user_input)
         if faq_response:
-            return faq_response
+            return "faq", faq_response
         
         # Step 2: Check for keyword-based responses
-        keyword_response = self._extract_keyword_based_response(user_input)
+        with self.metrics.timer("chatbot_stage_latency_seconds", stage="keyword"):
+            keyword_response = self._extract_keyword_based_response(user_input)
         if keyword_response:
-            return keyword_response
+            return "keyword", keyword_response
         
         # Step 3: Check for name-based queries (who is X?)
-        if self._is_person_query(user_input):
-            return self._handle_person_query(user_input)
+        with self.metrics.timer("chatbot_stage_latency_seconds", stage="person"):
+            person_match = self._match_person_query(user_input)
+            person_response = self._handle_person_query(user_input, person_match) if person_match else None
+        if person_response:
+            return "person", person_response
         
         # Step 4: Check for irrelevant queries that we should reject
-        irrelevant_response = self._check_irrelevant_query(user_input)
+        with self.metrics.timer("chatbot_stage_latency_seconds", stage="irrelevant"):
+            irrelevant_response = self._check_irrelevant_query(user_input)
         if irrelevant_response:
-            return irrelevant_response
+            return "irrelevant", irrelevant_response
         
-        # Step 5: If we get here, try to generate a response with GPT-2
+        return None, None
+
+    def _route_semantic(self, user_input):
+        """Run the embedding-based routing tiers and return (tier, response), or (None, None)"""
+        # Step 5: Look up paraphrased FAQ questions by embedding similarity
+        if self.faq_retriever:
+            with self.metrics.timer("chatbot_stage_latency_seconds", stage="semantic_faq"):
+                semantic_response = self.faq_retriever.search(user_input)
+            if semantic_response:
+                return "semantic_faq", semantic_response
+        
+        # Step 6: Reuse an accepted GPT-2 answer to a similar earlier question
+        if self.semantic_cache:
+            with self.metrics.timer("chatbot_stage_latency_seconds", stage="semantic_cache"):
+                cached_response = self.semantic_cache.get(user_input)
+            if cached_response:
+                return "semantic_cache", cached_response
+        
+        return None, None
+
+    def get_gpt2_response(self, user_input):
+        """Generate a response with GPT-2, falling back to a canned answer on errors"""
+        # Step 7: If we get here, try to generate a response with GPT-2
+        self.metrics.inc("chatbot_tier_hits_total", tier="gpt2")
         try:
-            return self._generate_gpt2_response(user_input)
+            with self.metrics.timer("chatbot_stage_latency_seconds", stage="gpt2"):
+                response = self._generate_gpt2_response(user_input)
         except Exception as e:
+            print(f"Error generating GPT-2 response: {str(e)}")
+            self.metrics.inc("chatbot_gpt2_fallbacks_total", reason="exception")
             return "I'm sorry, but I can only answer questions about SM Technology's services, management team, and company structure."
+        
+        if self.response_cache:
+            self.response_cache.put(user_input, response, "gpt2")
+        return response
+
+    def get_gpt2_responses(self, user_inputs):
+        """Generate GPT-2 responses for several inputs with one batched call"""
+        self.metrics.inc("chatbot_tier_hits_total", len(user_inputs), tier="gpt2")
+        try:
+            with self.metrics.timer("chatbot_stage_latency_seconds", stage="gpt2"):
+                responses = self._generate_gpt2_batch(user_inputs)
+        except Exception as e:
+            print(f"Error generating GPT-2 responses: {str(e)}")
+            self.metrics.inc("chatbot_gpt2_fallbacks_total", len(user_inputs), reason="exception")
+            return [
+                "I'm sorry, but I can only answer questions about SM Technology's services, management team, and company structure."
+            ] * len(user_inputs)
+        
+        if self.response_cache:
+            for user_input, response in zip(user_inputs, responses):
+                self.response_cache.put(user_input, response, "gpt2")
+        return responses
+
+    def _match_person_query(self, user_input):
+        """Return the person pattern match for the query, or None"""
+        _, match = self.person_matcher.search(user_input.lower())
+        return match
 
     def _is_person_query(self, user_input):
         """Check if the query is asking about a person"""
-        patterns = [
-            r"who is (\w+\s*\w*)",
-            r"tell me about (\w+\s*\w*)",
-            r"who('s| is) (\w+\s*\w*)",
-            r"what do you know about (\w+\s*\w*)"
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, user_input.lower())
-            if match:
-                return True
-        return False
+        return self._match_person_query(user_input) is not None
 
-    def _handle_person_query(self, user_input):
+    def _handle_person_query(self, user_input, match=None):
         """Handle queries about people"""
         # Extract the name from the query
         name = None
-        patterns = [
-            r"who is (\w+\s*\w*)",
-            r"tell me about (\w+\s*\w*)",
-            r"who('s| is) (\w+\s*\w*)",
-            r"what do you know about (\w+\s*\w*)"
-        ]
+        if match is None:
+            match = self._match_person_query(user_input)
         
-        for pattern in patterns:
-            match = re.search(pattern, user_input.lower())
-            if match:
-                # Get the name from the matching group
-                name = match.group(1) if len(match.groups()) == 1 else match.group(2)
-                break
+        if match:
+            # Get the name from the matching group
+            name = match.group(1) if len(match.groups()) == 1 else match.group(2)
         
         if not name:
             return "I'm not sure who you're asking about. Please provide a name."
@@ -234,87 +685,292 @@ class ChatbotService:
         """Check if the query is irrelevant to our dataset"""
         user_input_lower = user_input.lower()
         
-        # List of irrelevant topics
-        irrelevant_topics = [
-            "weather", "stock", "sport", "game", "movie", "music", "food", "restaurant",
-            "hotel", "flight", "train", "bus", "car", "bike", "book", "novel",
-            "news", "politics", "election", "president", "prime minister", "police", "crime",
-            "accident", "health", "doctor", "hospital", "medicine", "covid", "virus",
-            "vaccine", "investment", "bitcoin", "crypto", "blockchain"
-        ]
-        
         # Check if query contains irrelevant topics
-        for topic in irrelevant_topics:
-            if topic in user_input_lower:
-                return "I'm sorry, I can only answer questions about SM Technology, its services, management team, and company structure."
+        if self.topic_matcher.search(user_input_lower) >= 0:
+            return "I'm sorry, I can only answer questions about SM Technology, its services, management team, and company structure."
         
         # Check for personal questions
-        personal_patterns = [
-            r"(how are|how're|how do) you",
-            r"what('s| is) your name",
-            r"who are you",
-            r"tell me about yourself",
-            r"where are you",
-            r"how old are you",
-            r"what do you (like|love|enjoy|prefer)",
-            r"your (favorite|favourite)"
-        ]
-        
-        for pattern in personal_patterns:
-            if re.search(pattern, user_input_lower):
-                return "I'm an AI chatbot designed to provide information about SM Technology, its services, and management team."
+        idx, _ = self.personal_matcher.search(user_input_lower)
+        if idx >= 0:
+            return "I'm an AI chatbot designed to provide information about SM Technology, its services, and management team."
         
         # No irrelevant topics found
         return None
 
+    @property
+    def context(self):
+        return self._context
+
+    @context.setter
+    def context(self, context):
+        # The cached prompt prefix depends on the context, so rebuild it too
+        self._context = context
+        self._build_prefix_cache()
+
+    def _build_prompt_prefix(self):
+        """Build the static, context-only part of the GPT-2 prompt"""
+        return f"Information about SM Technology:\n{self.context}\n"
+
+    def _build_prompt_suffix(self, user_input):
+        """Build the question part of the GPT-2 prompt"""
+        # The prefix ends and the suffix starts with a newline, so tokenizing them
+        # separately yields the same tokens as tokenizing the whole prompt
+        return f"\nQuestion: {user_input}\nAnswer:"
+
+    def _build_prompt(self, user_input):
+        """Build the GPT-2 prompt for a question"""
+        return self._build_prompt_prefix() + self._build_prompt_suffix(user_input)
+
+    @property
+    def gpt2_ready(self):
+        """Whether the GPT-2 tier can serve requests"""
+        return self.model is not None and self.prefix_cache is not None
+
+    def attach_model(self, model, tokenizer, warmup=True):
+        """Attach a loaded GPT-2 model and tokenizer, enabling the GPT-2 tier"""
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        self.tokenizer = tokenizer
+        self.model = model
+        self._build_prefix_cache()
+        
+        # Run one generation so the first real request doesn't pay for lazy initialization
+        if warmup:
+            self._generate_gpt2_batch(["What is SM Technology?"])
+
+    def _build_prefix_cache(self):
+        """Tokenize the prompt prefix and precompute its GPT-2 key/value cache"""
+        if self.model is None or self.tokenizer is None:
+            self.prefix_cache = None
+            return
+        
+        prefix_ids = self.tokenizer.encode(self._build_prompt_prefix(), return_tensors="pt")
+        with torch.no_grad():
+            past_key_values = self.model(prefix_ids, use_cache=True).past_key_values
+        if hasattr(past_key_values, "to_legacy_cache"):
+            past_key_values = past_key_values.to_legacy_cache()
+        
+        # Stored as one tuple so readers always see a matching ids/cache pair
+        self.prefix_cache = (prefix_ids, past_key_values)
+
     def _generate_gpt2_response(self, user_input):
         """Generate a response using GPT-2"""
-        # Prepare prompt with context
-        prompt = f"Information about SM Technology:\n{self.context}\n\nQuestion: {user_input}\nAnswer:"
+        # Let the batcher merge this request with other concurrent ones
+        if self.batcher:
+            return self.batcher.submit(user_input).result()
         
-        input_ids = self.tokenizer.encode(prompt, return_tensors="pt")
+        return self._generate_gpt2_batch([user_input])[0]
+
+    def _run_generate(self, inputs, **kwargs):
+        """Run GPT-2 generate with in-generation answer validation and record its timings"""
+        prompt_length = inputs["input_ids"].shape[1]
+        timer = GenerationTimer()
+        
+        # Each row stops decoding as soon as its answer is accepted or rejected
+        stopping_criteria = StoppingCriteriaList([
+            timer,
+            AnswerStoppingCriteria(self.tokenizer, prompt_length)
+        ])
         
         # Generate with GPT-2
         with torch.no_grad():
             output = self.model.generate(
-                input_ids,
-                max_new_tokens=100,
-                num_return_sequences=1,
-                temperature=0.3,
-                do_sample=True,
-                top_k=30,
-                top_p=0.9,
+                **inputs,
+                **GENERATION_KWARGS,
                 pad_token_id=self.tokenizer.eos_token_id,
-                no_repeat_ngram_size=2
+                stopping_criteria=stopping_criteria,
+                **kwargs
             )
         
-        generated_text = self.tokenizer.decode(output[0], skip_special_tokens=True)
+        if timer.first_token is not None:
+            self.metrics.observe("chatbot_gpt2_prefill_seconds", timer.first_token - timer.start)
+            self.metrics.observe("chatbot_gpt2_decode_seconds", timer.last_token - timer.first_token)
+        generated_tokens = (output[:, prompt_length:] != self.tokenizer.eos_token_id).sum()
+        self.metrics.inc("chatbot_gpt2_tokens_generated_total", int(generated_tokens))
+        return output
+
+    def _prepare_generation_inputs(self, user_inputs):
+        """Build input ids, attention mask and cached past for a batch of questions"""
+        prefix_ids, past_key_values = self.prefix_cache
+        batch_size = len(user_inputs)
+        prefix_length = prefix_ids.shape[1]
+        
+        # Only the question suffixes are encoded, left-padded so every row ends at the answer
+        suffixes = [self._build_prompt_suffix(user_input) for user_input in user_inputs]
+        inputs = self.tokenizer(suffixes, return_tensors="pt", padding=True, padding_side="left")
+        
+        # Padding sits between the cached prefix and the suffix and is masked out,
+        # so positions still run on from the prefix for every row
+        input_ids = torch.cat([prefix_ids.expand(batch_size, -1), inputs["input_ids"]], dim=1)
+        attention_mask = torch.cat(
+            [torch.ones(batch_size, prefix_length, dtype=inputs["attention_mask"].dtype), inputs["attention_mask"]],
+            dim=1
+        )
+        
+        # generate() never writes into these views, so the shared cache stays intact
+        past_key_values = tuple(
+            tuple(tensor.expand(batch_size, -1, -1, -1) for tensor in layer)
+            for layer in past_key_values
+        )
+        
+        return {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "past_key_values": past_key_values
+        }, prefix_length
+
+    def _generate_gpt2_batch(self, user_inputs):
+        """Generate responses for several questions with one batched GPT-2 call"""
+        inputs, prefix_length = self._prepare_generation_inputs(user_inputs)
+        output = self._run_generate(inputs)
+        
+        # The context holds no "Answer:", so decoding can skip the prefix
+        return [
+            self._extract_answer(self.tokenizer.decode(sequence[prefix_length:], skip_special_tokens=True), user_input)
+            for user_input, sequence in zip(user_inputs, output)
+        ]
+
+    def stream_gpt2_response(self, user_input, executor=None, timeout=None):
+        """Start GPT-2 generation for a question and return an iterator over its stream events.
+
+        Generation is submitted to `executor` (anything with a concurrent.futures
+        style submit) or to a new thread, before this method returns. The iterator
+        yields {"token": text} for each decoded piece of the answer line and ends
+        with {"response": answer, "done": True}, where answer has passed the same
+        validation as get_gpt2_response.
+
+        Text is only streamed once it can no longer turn into a red flag, and
+        answers that end up too short are never streamed. An answer can still be
+        rejected for growing too long after part of it was streamed; the final
+        event then has "replaced": True and clients must show its response
+        instead of the streamed tokens. With a `timeout`, generation stops after
+        that many seconds and a stalled stream ends with the fallback answer.
+        """
+        inputs, prefix_length = self._prepare_generation_inputs([user_input])
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout)
+        generate_kwargs = {"streamer": streamer}
+        if timeout:
+            generate_kwargs["max_time"] = timeout
+        
+        def generate():
+            try:
+                return self._run_generate(inputs, **generate_kwargs)
+            except Exception:
+                # Unblock the consumer, which would otherwise wait on the streamer forever
+                streamer.end()
+                raise
+        
+        if executor:
+            future = executor.submit(generate)
+        else:
+            future = Future()
+            threading.Thread(target=_run_into_future, args=(future, generate), daemon=True).start()
         
+        return self._iter_stream_events(user_input, streamer, future, prefix_length)
+
+    def _iter_stream_events(self, user_input, streamer, future, prefix_length):
+        """Yield the safe part of the answer line as it streams in, then the validated answer"""
+        answer = ""
+        streamed = 0
+        finished = False
+        try:
+            for text in streamer:
+                if finished:
+                    continue
+                
+                # Leading whitespace is stripped from answers, so it is never streamed
+                answer = (answer + text).lstrip()
+                
+                # Only the first line of the answer is kept
+                if "\n" in answer or "Answer:" in answer:
+                    answer = re.split(r"\n|Answer:", answer, 1)[0]
+                    finished = True
+                
+                safe = self._stream_safe_length(answer, finished)
+                if safe > streamed:
+                    yield {"token": answer[streamed:safe]}
+                    streamed = safe
+            
+            # Generation can also end without closing the answer line
+            safe = self._stream_safe_length(answer, True)
+            if safe > streamed:
+                yield {"token": answer[streamed:safe]}
+                streamed = safe
+        except queue.Empty:
+            print("Error streaming GPT-2 response: timed out waiting for tokens")
+            self.metrics.inc("chatbot_gpt2_fallbacks_total", reason="timeout")
+            yield {"response": "Sorry, generating a response took too long. Please try again.", "done": True, "replaced": streamed > 0}
+            return
+        
+        self.metrics.inc("chatbot_tier_hits_total", tier="gpt2")
+        try:
+            output = future.result()
+            response = self._extract_answer(
+                self.tokenizer.decode(output[0][prefix_length:], skip_special_tokens=True), user_input
+            )
+        except Exception as e:
+            print(f"Error streaming GPT-2 response: {str(e)}")
+            self.metrics.inc("chatbot_gpt2_fallbacks_total", reason="exception")
+            response = "I'm sorry, but I can only answer questions about SM Technology's services, management team, and company structure."
+        else:
+            if self.response_cache:
+                self.response_cache.put(user_input, response, "gpt2")
+        
+        yield {"response": response, "done": True, "replaced": answer[:streamed].rstrip() != response[:streamed].rstrip()}
+
+    def _stream_safe_length(self, answer, finished):
+        """Return how much of a partial answer line can be streamed without showing rejected text"""
+        if finished:
+            _, rejection = self._check_answer("Answer:" + answer)
+            return 0 if rejection else len(answer)
+        
+        # Nothing more is streamed once the answer is sure to be rejected
+        if any(flag in answer for flag in ACTIVE_RED_FLAGS) or len(answer.rstrip()) > MAX_ANSWER_LENGTH:
+            return 0
+        if len(answer) < MIN_ANSWER_LENGTH:
+            return 0
+        
+        # Hold back a tail that could still become a red flag or the "Answer:" marker
+        for start in range(max(0, len(answer) - STREAM_HOLDBACK), len(answer)):
+            tail = answer[start:]
+            if any(prefix.startswith(tail) for prefix in STREAM_HELD_PREFIXES):
+                return start
+        return len(answer)
+
+    def _extract_answer(self, generated_text, user_input=None):
+        """Extract and validate the answer part of a generated text; accepted answers go to the semantic cache"""
+        response, rejection = self._check_answer(generated_text)
+        if rejection:
+            self.metrics.inc("chatbot_gpt2_fallbacks_total", reason=rejection)
+            return "I'm sorry, I can only answer questions about SM Technology, its services, management team, and company structure."
+        
+        if self.semantic_cache and user_input is not None:
+            try:
+                self.semantic_cache.put(user_input, response)
+            except Exception as e:
+                print(f"Error caching GPT-2 response: {str(e)}")
+        return response
+
+    def _check_answer(self, generated_text):
+        """Extract the answer part of a generated text; returns (answer, rejection reason or None)"""
         # Extract the answer part
         if "Answer:" in generated_text:
             response = generated_text.split("Answer:")[1].strip()
             # Clean up and format response
             if "\n" in response:
-                response = response.split("\n")[0]
+                response = response.split("\n")[0].rstrip()
         else:
-            return "I'm sorry, I can only answer questions about SM Technology, its services, management team, and company structure."
+            return None, "no_answer"
         
         # Filter out nonsensical or fabricated responses
-        red_flags = [
-            "I am", "I have", "My name", "I'm a", "I work", "I don't",
-            "BDD", "blog post", "years", "fan",
-            "The CEO is the CEO", "The Chairman is the Chairman",
-            "MD.", "Mr.", "Dr."  # Be cautious with titles not in our dataset
-        ]
-        
-        for flag in red_flags:
-            if flag in response and not any(flag in person for person in [
-                "MD. Monir Hossain", "MD. Shamim Miah", "MD. Jabed", "MST. Sabina Akter"
-            ]):
-                return "I'm sorry, I can only answer questions about SM Technology, its services, management team, and company structure."
+        for flag in ACTIVE_RED_FLAGS:
+            if flag in response:
+                return response, "red_flag"
         
         # Check for reasonable length
-        if len(response) > 200 or len(response) < 10:
-            return "I'm sorry, I can only answer questions about SM Technology, its services, management team, and company structure."
+        if len(response) > MAX_ANSWER_LENGTH:
+            return response, "too_long"
+        if len(response) < MIN_ANSWER_LENGTH:
+            return response, "too_short"
         
-        return response
+        return response, None
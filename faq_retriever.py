@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+
+class SemanticFaqRetriever:
+    """Answer paraphrased FAQ questions with a nearest-neighbour lookup over sentence embeddings.
+
+    The FAQ questions are batch-encoded once and their embeddings written to an
+    .npy file. Later startups memory-map that file read-only instead of
+    re-encoding, as long as the questions and the embedding model are
+    unchanged, so its pages are loaded on demand and shared between processes.
+    Search is an exact inner-product scan over the mapped matrix.
+    """
+
+    def __init__(self, questions, answers, model_name="all-MiniLM-L6-v2",
+                 index_path="faq_index.npy", threshold=0.75, batch_size=64, encoder=None):
+        if np is None or SentenceTransformer is None:
+            raise ImportError("numpy and sentence-transformers are required for semantic FAQ retrieval")
+
+        self.answers = list(answers)
+        self.threshold = threshold
+        self.model_name = model_name
+        self.encoder = encoder or SentenceTransformer(model_name, device="cpu")
+        self.embeddings = self._load_or_build_index(list(questions), index_path, batch_size)
+
+    def _fingerprint(self, questions):
+        """Identify the index contents by embedding model and question list"""
+        digest = hashlib.sha256(self.model_name.encode("utf-8"))
+        for question in questions:
+            digest.update(b"\0")
+            digest.update(question.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _load_or_build_index(self, questions, index_path, batch_size):
+        """Memory-map the persisted index, rebuilding it if it is missing or stale"""
+        meta_path = index_path + ".json"
+        fingerprint = self._fingerprint(questions)
+
+        if os.path.exists(index_path) and os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") == fingerprint:
+                return np.load(index_path, mmap_mode="r")
+
+        embeddings = self.encode(questions, batch_size=batch_size)
+
+        # Write to per-process temporary files first, so neither a crash nor
+        # workers building the same index at once leave a half-written one behind
+        index_temp_path = f"{index_path}.{os.getpid()}.tmp"
+        meta_temp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(index_temp_path, "wb") as f:
+            np.save(f, embeddings)
+        with open(meta_temp_path, "w") as f:
+            json.dump({"fingerprint": fingerprint, "model": self.model_name, "size": len(questions)}, f)
+        os.replace(index_temp_path, index_path)
+        os.replace(meta_temp_path, meta_path)
+
+        return np.load(index_path, mmap_mode="r")
+
+    def encode(self, texts, batch_size=64):
+        """Encode texts into L2-normalized float32 vectors, so inner product is cosine similarity"""
+        embeddings = self.encoder.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def search(self, user_input):
+        """Return the answer of the closest FAQ question if it is similar enough, else None"""
+        if len(self.embeddings) == 0:
+            return None
+
+        scores = self.embeddings @ self.encode([user_input])[0]
+        best = int(scores.argmax())
+        if scores[best] >= self.threshold:
+            return self.answers[best]
+
+        return None
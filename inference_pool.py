@@ -0,0 +1,48 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolBusyError(Exception):
+    """Raised when the inference backlog is full"""
+
+
+class InferencePool:
+    """Run blocking inference on a dedicated thread pool with a bounded backlog.
+
+    At most `workers` calls run at once and at most `max_queue` more wait for a
+    worker; further calls are rejected with PoolBusyError instead of piling up.
+    A call that is still waiting or running after `timeout` seconds raises
+    asyncio.TimeoutError to its caller. Its slot is released once the call
+    has actually finished.
+    """
+
+    def __init__(self, workers=8, max_queue=32, timeout=30.0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) on the pool and return a concurrent.futures.Future"""
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusyError("Inference queue is full")
+
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, fn, *args, timeout=None):
+        """Run fn(*args) on the pool and await its result, within `timeout` or the pool default"""
+        future = self.submit(fn, *args)
+
+        # A timed-out call that has not started yet is cancelled by wait_for
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
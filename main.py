@@ -1,17 +1,308 @@
 import os
 import json
 import sys
-from fastapi import FastAPI, Body
+import hashlib
+import time
+import signal
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Body, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from transformers import GPT2LMHeadModel, GPT2Tokenizer
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import List
+from pydantic import BaseModel, Field
+from transformers import GPT2Tokenizer
 
 # Add the services directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.venv', 'services'))
 
 from chatbot_service import ChatbotService
+from faq_retriever import SemanticFaqRetriever
+from inference_pool import InferencePool, PoolBusyError
+from response_cache import ResponseCache
+from metrics import Metrics, write_snapshot, read_snapshots
+from prefork import PreforkServer, process_memory
+from quantization import load_model
+from semantic_cache import SemanticAnswerCache
+from static_responses import StaticResponse
 
-app = FastAPI()
+# Shared state, populated by the lifespan hook
+json_data = None
+model = None
+tokenizer = None
+chatbot_service = None
+
+# Pre-serialized payloads of the static endpoints, keyed by path
+static_responses = {}
+
+# Serializes dataset reloads with the model loader, which both replace parts of chatbot_service
+reload_lock = threading.Lock()
+
+# Status of each component ("loading", "ready", "failed" or "disabled"), reported by /ready
+readiness = {
+    "dataset": "loading",
+    "routing_tiers": "loading",
+    "gpt2": "loading",
+    "semantic_faq": "loading" if os.getenv("SEMANTIC_FAQ_ENABLED", "0") == "1" else "disabled",
+    "semantic_cache": "loading" if os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1" else "disabled"
+}
+
+# Per-tier and per-stage instrumentation of the response pipeline
+metrics = Metrics()
+metrics.describe("chatbot_tier_hits_total", "Requests answered by each routing tier")
+metrics.describe("chatbot_stage_latency_seconds", "Time spent in each stage of the response pipeline")
+metrics.describe("chatbot_gpt2_prefill_seconds", "Time from the start of a GPT-2 generate call to its first token")
+metrics.describe("chatbot_gpt2_decode_seconds", "Time spent decoding after the first GPT-2 token")
+metrics.describe("chatbot_gpt2_tokens_generated_total", "Tokens generated by GPT-2")
+metrics.describe("chatbot_gpt2_fallbacks_total", "GPT-2 answers replaced by the fallback message, by reason")
+metrics.describe("chatbot_process_memory_bytes", "Memory of the serving process (rss, pss, shared, private)")
+
+# With pre-fork workers, each one exports its metrics to this directory so any
+# worker answering a /metrics scrape can report the totals across all of them
+metrics_dir = None
+metrics_worker = None
+
+# PID of the pre-fork master, which forwards dataset reloads to every worker
+prefork_master = None
+
+def build_response_cache():
+    """Build the in-process cache of answers to repeated questions, or None if it is disabled"""
+    if int(os.getenv("RESPONSE_CACHE_SIZE", "1024")) <= 0:
+        return None
+    return ResponseCache(
+        max_size=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+        cache_gpt2=os.getenv("RESPONSE_CACHE_GPT2", "0") == "1"
+    )
+
+# In-process cache of answers to repeated questions
+response_cache = build_response_cache()
+
+# Dedicated executor for GPT-2 generation, so the event loop stays free
+inference_pool = InferencePool(
+    workers=int(os.getenv("INFERENCE_WORKERS", "8")),
+    max_queue=int(os.getenv("INFERENCE_MAX_QUEUE", "32")),
+    timeout=float(os.getenv("INFERENCE_TIMEOUT", "30"))
+)
+
+def dataset_path():
+    return os.path.join(os.getcwd(), "dataset.json")
+
+def load_dataset():
+    """Load dataset.json from the working directory"""
+    global json_data
+    try:
+        data_path = dataset_path()
+        with open(data_path, "r") as f:
+            json_data = json.load(f)
+        readiness["dataset"] = "ready"
+        print(f"Successfully loaded dataset from {data_path}")
+    except Exception as e:
+        print(f"Error loading dataset: {str(e)}")
+        readiness["dataset"] = "failed"
+        json_data = None
+
+def preload_models():
+    """Load GPT-2 and its tokenizer into the module globals"""
+    global model, tokenizer
+    inference_mode = os.getenv("GPT2_INFERENCE_MODE", "fp32")
+    tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+    model = load_model("gpt2", inference_mode)
+    print(f"Successfully loaded GPT-2 model ({inference_mode})")
+
+def build_static_responses(data):
+    """Serialize and compress the static endpoint payloads for the current dataset"""
+    global static_responses
+    max_age = int(os.getenv("STATIC_MAX_AGE", "0"))
+    
+    # Built into a new dict and swapped in with one assignment
+    static_responses = {
+        "/": StaticResponse({"message": "Welcome to the SM Technology GPT-2 Chatbot!"}, max_age),
+        "/faq": StaticResponse({"faq": data["faq"]} if data else {"error": "FAQ data not available"}, max_age)
+    }
+
+def load_models():
+    """Load GPT-2 and the optional semantic FAQ index; runs in the background"""
+    # Load the GPT-2 model and the tokenizer shared with the chatbot service,
+    # unless a pre-fork master already loaded them
+    try:
+        if model is None:
+            preload_models()
+        with reload_lock:
+            chatbot_service.attach_model(model, tokenizer)
+        readiness["gpt2"] = "ready"
+        print("GPT-2 tier warmed up")
+    except Exception as e:
+        readiness["gpt2"] = "failed"
+        print(f"Error loading GPT-2 model: {str(e)}")
+    
+    # Optionally build the semantic FAQ retrieval tier
+    if readiness["semantic_faq"] == "loading":
+        try:
+            with reload_lock:
+                chatbot_service.faq_retriever = build_faq_retriever(json_data)
+            readiness["semantic_faq"] = "ready"
+            print("Successfully loaded semantic FAQ index")
+        except Exception as e:
+            readiness["semantic_faq"] = "failed"
+            print(f"Error loading semantic FAQ index: {str(e)}")
+    
+    # Optionally build the semantic cache of GPT-2 answers
+    if readiness["semantic_cache"] == "loading":
+        try:
+            with reload_lock:
+                chatbot_service.semantic_cache = build_semantic_cache(json_data, chatbot_service.faq_retriever)
+            readiness["semantic_cache"] = "ready"
+            print("Successfully loaded semantic answer cache")
+        except Exception as e:
+            readiness["semantic_cache"] = "failed"
+            print(f"Error loading semantic answer cache: {str(e)}")
+
+def build_faq_retriever(data):
+    """Build the semantic FAQ retriever for the FAQ entries of `data`"""
+    return SemanticFaqRetriever(
+        [faq["question"] for faq in data["faq"]],
+        [faq["answer"] for faq in data["faq"]],
+        model_name=os.getenv("SEMANTIC_FAQ_MODEL", "all-MiniLM-L6-v2"),
+        index_path=os.getenv("SEMANTIC_FAQ_INDEX", os.path.join(os.getcwd(), "faq_index.npy")),
+        threshold=float(os.getenv("SEMANTIC_FAQ_THRESHOLD", "0.75"))
+    )
+
+def dataset_fingerprint(data):
+    """Identify the dataset contents, so cached answers are never reused across datasets"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+def build_semantic_cache(data, faq_retriever=None, encoder=None):
+    """Build the semantic answer cache, sharing the FAQ retriever's encoder when it uses the same model"""
+    model_name = os.getenv("SEMANTIC_CACHE_MODEL", os.getenv("SEMANTIC_FAQ_MODEL", "all-MiniLM-L6-v2"))
+    if encoder is None and faq_retriever is not None and faq_retriever.model_name == model_name:
+        encoder = faq_retriever.encoder
+    return SemanticAnswerCache(
+        model_name=model_name,
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+        max_size=int(os.getenv("SEMANTIC_CACHE_SIZE", "4096")),
+        path=os.getenv("SEMANTIC_CACHE_PATH") or None,
+        fingerprint=dataset_fingerprint(data),
+        encoder=encoder
+    )
+
+def reload_dataset():
+    """Re-read dataset.json and swap in a service rebuilt for the sections that changed.
+
+    Returns the sorted list of changed sections. Raises ValueError if the file
+    can't be read or parsed or lacks data the service is built from, leaving the
+    current service in place.
+    """
+    global json_data, chatbot_service, response_cache
+    
+    try:
+        with open(dataset_path(), "r") as f:
+            new_data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not load dataset: {str(e)}")
+    if not isinstance(new_data, dict) or not isinstance(new_data.get("faq"), list):
+        raise ValueError("Could not load dataset: missing FAQ list")
+    
+    with reload_lock:
+        old_service = chatbot_service
+        
+        # Step 1: Build the new service next to the one serving traffic
+        try:
+            new_service, changed = old_service.with_data(new_data)
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            raise ValueError(f"Could not load dataset: invalid data ({type(e).__name__}: {str(e)})")
+        if not changed:
+            return []
+        if "faq" in changed and old_service.faq_retriever is not None:
+            new_service.faq_retriever = build_faq_retriever(new_data)
+        
+        # Step 2: Give it empty caches. Requests still finishing on the old service
+        # store their answers, derived from the old data, in the old caches
+        if old_service.response_cache:
+            response_cache = new_service.response_cache = build_response_cache()
+        if old_service.semantic_cache:
+            new_service.semantic_cache = build_semantic_cache(new_data, encoder=old_service.semantic_cache.encoder)
+        
+        # Step 3: Swap it in; requests already holding the old service finish on it
+        chatbot_service = new_service
+        json_data = new_data
+        if "faq" in changed:
+            build_static_responses(new_data)
+        
+        # Step 4: Let the old batcher finish its queue and stop
+        if old_service.batcher:
+            old_service.batcher.close()
+    
+    print(f"Reloaded dataset, changed sections: {', '.join(sorted(changed))}")
+    return sorted(changed)
+
+def reload_worker_dataset():
+    """Reload the dataset when the pre-fork master forwards a reload to this worker"""
+    if not chatbot_service:
+        return
+    try:
+        reload_dataset()
+    except Exception as e:
+        print(f"Error reloading dataset: {str(e)}")
+
+def watch_dataset(interval):
+    """Reload the dataset whenever dataset.json's modification time changes"""
+    def mtime():
+        try:
+            return os.stat(dataset_path()).st_mtime_ns
+        except OSError:
+            return None
+    
+    last_mtime = mtime()
+    while True:
+        time.sleep(interval)
+        current_mtime = mtime()
+        if current_mtime is None or current_mtime == last_mtime:
+            continue
+        last_mtime = current_mtime
+        try:
+            reload_dataset()
+        except Exception as e:
+            print(f"Error reloading dataset: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app):
+    global chatbot_service
+    
+    # The routing tiers only need the dataset, so they serve traffic right away
+    load_dataset()
+    build_static_responses(json_data)
+    if json_data:
+        chatbot_service = ChatbotService(
+            None,
+            json_data,
+            max_batch_size=int(os.getenv("GPT2_MAX_BATCH_SIZE", "8")),
+            batch_wait=float(os.getenv("GPT2_BATCH_WAIT_MS", "10")) / 1000,
+            response_cache=response_cache,
+            metrics=metrics
+        )
+        readiness["routing_tiers"] = "ready"
+        print("Chatbot service initialized successfully")
+        
+        # GPT-2 loads and warms up in the background
+        threading.Thread(target=load_models, name="model-loader", daemon=True).start()
+        
+        # Optionally pick up edits to dataset.json without a restart
+        watch_interval = float(os.getenv("DATASET_WATCH_INTERVAL", "0"))
+        if watch_interval > 0:
+            threading.Thread(target=watch_dataset, args=(watch_interval,), name="dataset-watcher", daemon=True).start()
+    else:
+        readiness["routing_tiers"] = readiness["gpt2"] = "failed"
+        print("Failed to initialize chatbot service")
+    
+    yield
+    
+    inference_pool.shutdown()
+    if chatbot_service and chatbot_service.semantic_cache:
+        chatbot_service.semantic_cache.save()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -22,55 +313,183 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load the JSON data first to check if it exists
-try:
-    data_path = os.path.join(os.getcwd(), "dataset.json")
-    with open(data_path, "r") as f:
-        json_data = json.load(f)
-    print(f"Successfully loaded dataset from {data_path}")
-except Exception as e:
-    print(f"Error loading dataset: {str(e)}")
-    json_data = None
-
-# Load the GPT-2 model
-try:
-    model = GPT2LMHeadModel.from_pretrained("gpt2")
-    tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
-    print("Successfully loaded GPT-2 model")
-except Exception as e:
-    print(f"Error loading GPT-2 model: {str(e)}")
-    model = None
-    tokenizer = None
-
-# Instantiate the ChatbotService with the model and JSON data
-if json_data and model:
-    chatbot_service = ChatbotService(model, json_data)
-    print("Chatbot service initialized successfully")
-else:
-    print("Failed to initialize chatbot service")
-    chatbot_service = None
-
 class ChatInput(BaseModel):
     message: str
 
+class ChatBatchInput(BaseModel):
+    messages: List[str] = Field(..., max_length=int(os.getenv("CHAT_BATCH_MAX_MESSAGES", "1000")))
+
 @app.get("/")
-def read_root():
-    return {"message": "Welcome to the SM Technology GPT-2 Chatbot!"}
+async def read_root(request: Request):
+    return static_responses["/"].respond(request)
+
+@app.get("/ready")
+async def ready():
+    # Ready as soon as the routing tiers can answer; GPT-2 may still be loading
+    is_ready = readiness["routing_tiers"] == "ready"
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "components": readiness}
+    )
+
+def _warming_up_response():
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "5"},
+        content={"response": "The chatbot is still starting up. Please try again in a moment."}
+    )
+
+async def _fast_response(service, message):
+    """Answer from the cheap tiers: lexical ones inline, embedding ones off the event loop"""
+    _, response = service.route_lexical(message)
+    if response is None and service.has_semantic_tiers:
+        _, response = await asyncio.to_thread(service.route_semantic, message)
+    return response
 
 @app.post("/chat")
 async def chat(chat_input: ChatInput):
-    if not chatbot_service:
+    # Use one service for the whole request, even if a reload swaps it meanwhile
+    service = chatbot_service
+    if not service:
         return {"response": "Chatbot service is not available at the moment. Please try again later."}
     
-    response = chatbot_service.get_response(chat_input.message)
+    # Cheap routing tiers answer first; only their embedding lookups leave the event loop
+    response = await _fast_response(service, chat_input.message)
+    if response:
+        return {"response": response}
+    
+    if not service.gpt2_ready:
+        return _warming_up_response()
+    
+    # GPT-2 generation runs on the inference pool
+    try:
+        response = await inference_pool.run(service.get_gpt2_response, chat_input.message)
+    except PoolBusyError:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "1"},
+            content={"response": "The chatbot is busy right now. Please try again in a moment."}
+        )
+    except asyncio.TimeoutError:
+        return JSONResponse(
+            status_code=504,
+            content={"response": "Sorry, generating a response took too long. Please try again."}
+        )
     return {"response": response}
 
+@app.post("/chat/batch")
+async def chat_batch(batch_input: ChatBatchInput):
+    service = chatbot_service
+    if not service:
+        return {"error": "Chatbot service is not available at the moment. Please try again later."}
+    
+    # Routing and batched generation for the whole list run as one pool task;
+    # messages needing GPT-2 while it loads come back with the "unavailable" tier
+    try:
+        results = await inference_pool.run(
+            service.get_responses,
+            batch_input.messages,
+            int(os.getenv("CHAT_BATCH_GENERATION_SIZE", "16")),
+            timeout=float(os.getenv("CHAT_BATCH_TIMEOUT", "600"))
+        )
+    except PoolBusyError:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "1"},
+            content={"error": "The chatbot is busy right now. Please try again in a moment."}
+        )
+    except asyncio.TimeoutError:
+        return JSONResponse(
+            status_code=504,
+            content={"error": "Sorry, answering the batch took too long. Please try again with fewer messages."}
+        )
+    return {"results": [{"response": response, "tier": tier} for tier, response in results]}
+
+def _sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(chat_input: ChatInput):
+    service = chatbot_service
+    if not service:
+        return {"response": "Chatbot service is not available at the moment. Please try again later."}
+    
+    # Fast-tier answers are sent as a single event
+    response = await _fast_response(service, chat_input.message)
+    if response:
+        return StreamingResponse(
+            iter([_sse_event({"response": response, "done": True})]),
+            media_type="text/event-stream"
+        )
+    
+    if not service.gpt2_ready:
+        return _warming_up_response()
+    
+    # GPT-2 tokens are streamed as they are decoded
+    try:
+        events = service.stream_gpt2_response(
+            chat_input.message, executor=inference_pool, timeout=inference_pool.timeout
+        )
+    except PoolBusyError:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "1"},
+            content={"response": "The chatbot is busy right now. Please try again in a moment."}
+        )
+    return StreamingResponse(
+        (_sse_event(event) for event in events),
+        media_type="text/event-stream"
+    )
+
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: str = Header(None)):
+    # Disabled unless a token is configured
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    if x_admin_token != admin_token:
+        return JSONResponse(status_code=403, content={"error": "Invalid admin token"})
+    if not chatbot_service:
+        return JSONResponse(status_code=503, content={"error": "Chatbot service is not available"})
+    
+    try:
+        changed = await asyncio.to_thread(reload_dataset)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    
+    # Only this worker has reloaded so far; with pre-fork workers, the master
+    # forwards the reload to all of them, and they pick it up within moments
+    if prefork_master:
+        os.kill(prefork_master, signal.SIGHUP)
+    return {"reloaded": bool(changed), "changed_sections": changed}
+
+@app.get("/metrics")
+def get_metrics():
+    # Counters and histograms are summed over all workers, with the other workers'
+    # counts as of their last export, up to METRICS_EXPORT_INTERVAL seconds old.
+    # The memory gauge is reported per worker, and shared pages show up as RSS - PSS
+    record_process_memory()
+    snapshots = read_snapshots(metrics_dir, exclude=f"worker-{metrics_worker}.json") if metrics_dir else ()
+    return PlainTextResponse(metrics.render(snapshots), media_type="text/plain; version=0.0.4")
+
+# Each pre-fork worker has its own cache, so these are the answering worker's
+# stats; a dataset reload starts a new, empty cache
+@app.get("/cache/stats")
+async def get_cache_stats():
+    if response_cache:
+        return response_cache.stats()
+    return {"error": "Response cache is disabled"}
+
+@app.get("/cache/semantic/stats")
+async def get_semantic_cache_stats():
+    if chatbot_service and chatbot_service.semantic_cache:
+        return chatbot_service.semantic_cache.stats()
+    return {"error": "Semantic answer cache is disabled"}
+
 # Test FAQs directly from the dataset
 @app.get("/faq")
-async def get_faq():
-    if json_data:
-        return {"faq": json_data["faq"]}
-    return {"error": "FAQ data not available"}
+async def get_faq(request: Request):
+    return static_responses["/faq"].respond(request)
 
 # Test prompts
 test_prompts = {
@@ -130,6 +549,78 @@ test_prompts = {
 }
 
 
+def record_process_memory():
+    memory = process_memory()
+    if memory:
+        for kind, value in memory.items():
+            metrics.set("chatbot_process_memory_bytes", value, kind=kind, worker=metrics_worker or 0, pid=os.getpid())
+
+def export_metrics(interval):
+    """Write this worker's metrics for the other workers' /metrics responses every `interval` seconds.
+
+    Requests this worker answered show up in the other workers' /metrics
+    responses only after the next export, so totals lag by up to `interval`.
+    """
+    path = os.path.join(metrics_dir, f"worker-{metrics_worker}.json")
+    while True:
+        record_process_memory()
+        try:
+            write_snapshot(metrics, path)
+        except OSError as e:
+            print(f"Error exporting metrics: {str(e)}")
+        time.sleep(interval)
+
+def configure_worker(worker_id):
+    """Size torch's intra-op thread pool to this worker's share of the cores and share its metrics"""
+    import torch
+    global metrics_dir, metrics_worker, prefork_master
+    
+    workers = int(os.getenv("WEB_WORKERS", "1"))
+    if workers > 1:
+        prefork_master = os.getppid()
+        metrics_worker = worker_id
+        metrics_dir = os.environ["METRICS_DIR"]
+        interval = float(os.getenv("METRICS_EXPORT_INTERVAL", "1"))
+        threading.Thread(target=export_metrics, args=(interval,), name="metrics-exporter", daemon=True).start()
+    
+    threads = int(os.getenv("TORCH_NUM_THREADS", "0"))
+    if not threads and workers > 1:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    if not threads:
+        return
+    torch.set_num_threads(threads)
+    print(f"Worker {worker_id} ({os.getpid()}) using {threads} torch threads")
+
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = int(os.getenv("WEB_WORKERS", "1"))
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", "8000"))
+    
+    if workers > 1:
+        # Workers exchange metrics through files; a restarted worker starts its
+        # counters from zero, which Prometheus treats as a counter reset
+        import tempfile
+        os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="chatbot-metrics-"))
+        for name in os.listdir(os.environ["METRICS_DIR"]):
+            if name.startswith("worker-"):
+                os.remove(os.path.join(os.environ["METRICS_DIR"], name))
+        
+        # Load the weights once in the master; forked workers share them copy-on-write
+        try:
+            preload_models()
+        except Exception as e:
+            print(f"Error preloading GPT-2 model, workers will load their own: {str(e)}")
+        PreforkServer(
+            app,
+            host=host,
+            port=port,
+            workers=workers,
+            on_fork=configure_worker,
+            on_reload=reload_worker_dataset,
+            memory_log_interval=float(os.getenv("WORKER_MEMORY_LOG_INTERVAL", "60"))
+        ).run()
+    else:
+        import uvicorn
+        configure_worker(0)
+        uvicorn.run(app, host=host, port=port)
\ No newline at end of file
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import threading
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class _Timer:
+    """Context manager observing the time spent in its block into a histogram"""
+
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms rendered in the Prometheus text format.
+
+    Processes serving the same app (pre-fork workers) each keep their own
+    registry; `snapshot()` exports one and `render(snapshots)` adds the exported
+    counters and histograms to this registry's, so any process can report the
+    totals. Gauges are not summed and should carry a label telling them apart.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._descriptions = {}
+
+    def describe(self, name, description):
+        self._descriptions[name] = description
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][idx] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def timer(self, name, **labels):
+        """Time a block: `with metrics.timer("stage_seconds", stage="faq"): ...`"""
+        return _Timer(self, name, labels)
+
+    def snapshot(self):
+        """Export the current values as JSON-serializable data for `render` in another process"""
+        with self._lock:
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, labels, value] for (name, labels), value in self._gauges.items()],
+                "histograms": [[name, labels, *value] for (name, labels), value in self._histograms.items()]
+            }
+
+    def render(self, snapshots=()):
+        """Render every metric in the Prometheus text exposition format, merged with `snapshots`"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: ([*value[0]], value[1], value[2]) for key, value in self._histograms.items()}
+
+        for snapshot in snapshots:
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in snapshot["gauges"]:
+                gauges[(name, tuple(tuple(label) for label in labels))] = value
+            for name, labels, bucket_counts, total, count in snapshot["histograms"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                if key in histograms:
+                    merged = histograms[key]
+                    bucket_counts = [a + b for a, b in zip(merged[0], bucket_counts)]
+                    total += merged[1]
+                    count += merged[2]
+                histograms[key] = (bucket_counts, total, count)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            self._render_header(lines, name, "counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name in sorted({name for name, _ in gauges}):
+            self._render_header(lines, name, "gauge")
+            for (metric, labels), value in sorted(gauges.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name in sorted({name for name, _ in histograms}):
+            self._render_header(lines, name, "histogram")
+            for (metric, labels), (bucket_counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def _render_header(self, lines, name, metric_type):
+        if name in self._descriptions:
+            lines.append(f"# HELP {name} {self._descriptions[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+
+def write_snapshot(metrics, path):
+    """Atomically write a registry's snapshot to `path`"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(metrics.snapshot(), f)
+    os.replace(temp_path, path)
+
+
+def read_snapshots(directory, exclude=None):
+    """Read the snapshots written to `directory`, skipping the file named `exclude`"""
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json") or name == exclude:
+            continue
+        try:
+            with open(os.path.join(directory, name), "r") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
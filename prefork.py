@@ -0,0 +1,152 @@
+import os
+import gc
+import time
+import signal
+import socket
+import threading
+
+
+def process_memory(pid="self"):
+    """Return the RSS, PSS and shared/private byte counts of a process, from /proc.
+
+    PSS splits each shared page between the processes mapping it, so the sum of
+    the workers' PSS is what they really cost together. Returns None where
+    /proc/<pid>/smaps_rollup is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    fields = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3 and parts[2] == "kB":
+            fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    }
+
+
+def _format_memory(memory):
+    if memory is None:
+        return "memory unavailable"
+    return " ".join(f"{key}={value / 2**20:.0f}MiB" for key, value in memory.items())
+
+
+class PreforkServer:
+    """Serve an ASGI app from several forked uvicorn workers sharing one listening socket.
+
+    Whatever the master loads before `run()` (the GPT-2 weights in particular) is
+    inherited by every worker as copy-on-write pages, so it occupies memory once
+    rather than once per worker. `on_fork` runs in each child before it starts
+    serving, for per-worker setup such as torch thread counts. Workers that exit
+    are replaced; SIGINT/SIGTERM stop them all. SIGHUP sent to the master is
+    forwarded to every worker, which then runs `on_reload` on a background thread.
+    """
+
+    def __init__(self, app, host="0.0.0.0", port=8000, workers=2, on_fork=None, on_reload=None,
+                 memory_log_interval=0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.on_fork = on_fork
+        self.on_reload = on_reload
+        self.memory_log_interval = memory_log_interval
+        self._children = {}
+        self._stopping = False
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+
+        # Move everything loaded so far out of the collector's reach, so its
+        # passes in the workers don't write to (and so copy) the shared pages
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGHUP, self._forward_reload)
+
+        for worker_id in range(self.workers):
+            self._spawn(worker_id, sock)
+        print(f"Master {os.getpid()} serving on {self.host}:{self.port} with {self.workers} workers")
+
+        next_memory_log = time.monotonic() + self.memory_log_interval
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+
+            if pid:
+                worker_id = self._children.pop(pid)
+                if not self._stopping:
+                    print(f"Worker {pid} exited with status {status}, restarting")
+                    self._spawn(worker_id, sock)
+                continue
+
+            if self.memory_log_interval > 0 and time.monotonic() >= next_memory_log:
+                self.log_memory()
+                next_memory_log = time.monotonic() + self.memory_log_interval
+            time.sleep(0.5)
+
+        sock.close()
+
+    def log_memory(self):
+        """Print the memory use of the master and of each worker"""
+        print(f"Master {os.getpid()}: {_format_memory(process_memory())}")
+        for pid, worker_id in sorted(self._children.items(), key=lambda item: item[1]):
+            print(f"Worker {worker_id} ({pid}): {_format_memory(process_memory(pid))}")
+
+    def _spawn(self, worker_id, sock):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = worker_id
+            return
+
+        # Child: default signal handling, per-worker setup, then serve until told to stop
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, self._reload if self.on_reload else signal.SIG_IGN)
+        exit_code = 0
+        try:
+            import uvicorn
+
+            if self.on_fork:
+                self.on_fork(worker_id)
+            server = uvicorn.Server(uvicorn.Config(self.app, lifespan="on"))
+            server.run(sockets=[sock])
+        except BaseException as e:
+            print(f"Worker {worker_id} failed: {str(e)}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+        self._signal_children(signal.SIGTERM)
+
+    def _forward_reload(self, signum, frame):
+        print(f"Master {os.getpid()} forwarding reload to {len(self._children)} workers")
+        self._signal_children(signal.SIGHUP)
+
+    def _signal_children(self, signum):
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _reload(self, signum, frame):
+        # Signal handlers run on the main thread, between steps of the event loop
+        threading.Thread(target=self.on_reload, name="worker-reload", daemon=True).start()
@@ -0,0 +1,165 @@
+"""GPT-2 inference modes, and an evaluation comparing them.
+
+`int8` converts GPT-2's Conv1D projections to nn.Linear and applies torch's
+dynamic quantization to every linear layer, the LM head included: weights are
+stored as int8 and activations are quantized on the fly, which cuts model
+memory roughly fourfold and speeds up CPU decoding.
+
+Running this module compares the modes on the `test_prompts` corpus, each in
+its own process so memory figures don't mix:
+    python quantization.py --modes fp32 int8 --repeat 3 --output quant.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import subprocess
+from collections import Counter
+
+import torch
+from torch import nn
+from transformers import GPT2LMHeadModel, GPT2Tokenizer
+from transformers.pytorch_utils import Conv1D
+
+INFERENCE_MODES = ("fp32", "int8")
+
+
+def conv1d_to_linear(module):
+    """Replace GPT-2's Conv1D layers with equivalent nn.Linear layers, in place"""
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            # Conv1D computes x @ weight + bias, with weight stored as (in, out)
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features, device="meta")
+            linear.weight = nn.Parameter(child.weight.detach().t().contiguous())
+            linear.bias = nn.Parameter(child.bias.detach())
+            setattr(module, name, linear)
+        else:
+            conv1d_to_linear(child)
+    return module
+
+
+def quantize_model(model):
+    """Return GPT-2 with int8 dynamically quantized linear layers; `model` is modified in place"""
+    conv1d_to_linear(model)
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_model(model_name="gpt2", mode="fp32"):
+    """Load GPT-2 for inference in the given mode"""
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Unknown inference mode {mode!r}, expected one of {', '.join(INFERENCE_MODES)}")
+
+    model = GPT2LMHeadModel.from_pretrained(model_name)
+    model.eval()
+    if mode == "int8":
+        model = quantize_model(model)
+    return model
+
+
+def model_size(model):
+    """Bytes taken by the model's serialized state dict, packed int8 weights included"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def evaluate_mode(args, mode):
+    """Answer every test prompt with GPT-2 in `mode`; returns latency, memory and filter outcomes"""
+    from benchmark import percentile
+    from chatbot_service import ChatbotService
+    from main import test_prompts
+    from prefork import process_memory
+
+    class EvaluatedChatbotService(ChatbotService):
+        """ChatbotService recording the outcome of the answer filters"""
+
+        outcomes = Counter()
+
+        def _check_answer(self, generated_text):
+            response, rejection = super()._check_answer(generated_text)
+            self.outcomes[rejection or "accepted"] += 1
+            return response, rejection
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    with open(args.dataset, "r") as f:
+        data = json.load(f)
+
+    tokenizer = GPT2Tokenizer.from_pretrained(args.tokenizer or args.model_name)
+    model = load_model(args.model_name, mode)
+    service = EvaluatedChatbotService(None, data)
+    service.attach_model(model, tokenizer)
+    service.outcomes = Counter()
+
+    # Every prompt goes straight to GPT-2: the fast tiers don't depend on the mode
+    torch.manual_seed(args.seed)
+    prompts = [prompt for _ in range(args.repeat) for prompts in test_prompts.values() for prompt in prompts]
+    latencies = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        service.get_gpt2_response(prompt)
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "threads": torch.get_num_threads(),
+        "prompts": len(prompts),
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000
+        },
+        "model_size_bytes": model_size(model),
+        "process_memory_bytes": process_memory(),
+        "outcomes": dict(service.outcomes),
+        "acceptance_rate": service.outcomes["accepted"] / max(1, sum(service.outcomes.values()))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare GPT-2 inference modes on the test_prompts corpus")
+    parser.add_argument("--modes", nargs="+", choices=INFERENCE_MODES, default=list(INFERENCE_MODES))
+    parser.add_argument("--model-name", default="gpt2", help="model name or path")
+    parser.add_argument("--tokenizer", help="tokenizer name or path, defaults to --model-name")
+    parser.add_argument("--dataset", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset.json"))
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads, 0 for torch's default")
+    parser.add_argument("--repeat", type=int, default=1, help="times each prompt is answered")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--json", action="store_true", help="print the results of a single mode as JSON")
+    args = parser.parse_args()
+
+    if args.json:
+        print(json.dumps(evaluate_mode(args, args.modes[0])))
+        return
+
+    # One process per mode, so each one's memory is measured on its own
+    results = []
+    for mode in args.modes:
+        command = [sys.executable, os.path.abspath(__file__), "--json", "--modes", mode,
+                   "--model-name", args.model_name, "--dataset", args.dataset, "--threads", str(args.threads),
+                   "--repeat", str(args.repeat), "--seed", str(args.seed)]
+        if args.tokenizer:
+            command += ["--tokenizer", args.tokenizer]
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for result in results:
+        memory = result["process_memory_bytes"] or {}
+        print(f"{result['mode']:5s} p50 {result['latency_ms']['p50']:8.1f} ms  p95 {result['latency_ms']['p95']:8.1f} ms  "
+              f"model {result['model_size_bytes'] / 2**20:7.1f} MiB  rss {memory.get('rss', 0) / 2**20:7.1f} MiB  "
+              f"accepted {result['acceptance_rate']:6.1%}  {result['outcomes']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"threads": args.threads, "repeat": args.repeat, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
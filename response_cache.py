@@ -0,0 +1,75 @@
+import re
+import time
+import threading
+from collections import OrderedDict, defaultdict
+
+
+def normalize_query(text):
+    """Fold case, whitespace and punctuation so trivially different inputs share a key"""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of chatbot responses with a time-to-live.
+
+    Entries remember the tier that produced them so hits, misses and evictions
+    can be reported per tier. Answers from the sampled GPT-2 tier are only
+    stored when `cache_gpt2` is set.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600.0, cache_gpt2=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_gpt2 = cache_gpt2
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = defaultdict(int)
+        self._misses = defaultdict(int)
+        self._evictions = defaultdict(int)
+
+    def get(self, user_input):
+        """Return the cached (tier, response) for the input, or None"""
+        key = normalize_query(user_input)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            response, tier, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._evictions[tier] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits[tier] += 1
+            return tier, response
+
+    def put(self, user_input, response, tier):
+        """Record a miss answered by `tier` and cache its response if the tier is cacheable"""
+        key = normalize_query(user_input)
+        with self._lock:
+            self._misses[tier] += 1
+            if tier == "gpt2" and not self.cache_gpt2:
+                return
+
+            self._entries[key] = (response, tier, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                _, (_, evicted_tier, _) = self._entries.popitem(last=False)
+                self._evictions[evicted_tier] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the cache size and per-tier hit, miss and eviction counts"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": dict(self._hits),
+                "misses": dict(self._misses),
+                "evictions": dict(self._evictions)
+            }
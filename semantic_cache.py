@@ -0,0 +1,172 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+
+class SemanticAnswerCache:
+    """Cache of accepted GPT-2 answers, looked up by sentence-embedding similarity.
+
+    A query whose embedding has a cosine similarity of at least `threshold` with
+    a stored query gets that query's answer, so paraphrases of a question share
+    one generation. The cache holds at most `max_size` answers and evicts the
+    least recently used. With a `path`, it is saved there on `save()` and loaded
+    back on startup if the embedding model and `fingerprint` (identifying the
+    data the answers came from) are unchanged.
+
+    The embeddings of recent misses are kept until their answer is stored, so a
+    query that falls through to GPT-2 is only encoded once.
+    """
+
+    def __init__(self, model_name="all-MiniLM-L6-v2", threshold=0.9, max_size=4096, path=None,
+                 fingerprint=None, encoder=None):
+        if np is None or (encoder is None and SentenceTransformer is None):
+            raise ImportError("numpy and sentence-transformers are required for the semantic answer cache")
+
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_size = max_size
+        self.path = path
+        self.fingerprint = fingerprint
+        self.encoder = encoder or SentenceTransformer(model_name, device="cpu")
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._queries = []
+        self._answers = []
+        self._last_used = []
+        self._pending = OrderedDict()
+        self._clock = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        if path:
+            self._load()
+
+    def encode(self, text):
+        """Encode a query into an L2-normalized float32 vector"""
+        embedding = self.encoder.encode(
+            [text],
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return np.ascontiguousarray(embedding[0], dtype=np.float32)
+
+    def get(self, user_input):
+        """Return the answer stored for the most similar query if it is similar enough, else None"""
+        vector = self.encode(user_input)
+        with self._lock:
+            if self._answers:
+                scores = self._vectors[:len(self._answers)] @ vector
+                best = int(scores.argmax())
+                if scores[best] >= self.threshold:
+                    self._hits += 1
+                    self._clock += 1
+                    self._last_used[best] = self._clock
+                    return self._answers[best]
+
+            self._misses += 1
+            self._pending[user_input] = vector
+            while len(self._pending) > self.max_size:
+                self._pending.popitem(last=False)
+            return None
+
+    def put(self, user_input, response):
+        """Store an accepted answer, evicting the least recently used one when full"""
+        with self._lock:
+            vector = self._pending.pop(user_input, None)
+        if vector is None:
+            vector = self.encode(user_input)
+        
+        with self._lock:
+            self._clock += 1
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+
+            if len(self._answers) < self.max_size:
+                slot = len(self._answers)
+                self._queries.append(user_input)
+                self._answers.append(response)
+                self._last_used.append(self._clock)
+            else:
+                slot = min(range(len(self._last_used)), key=self._last_used.__getitem__)
+                self._queries[slot] = user_input
+                self._answers[slot] = response
+                self._last_used[slot] = self._clock
+                self._evictions += 1
+            self._vectors[slot] = vector
+
+    def clear(self):
+        """Drop every stored answer"""
+        with self._lock:
+            self._queries = []
+            self._answers = []
+            self._last_used = []
+            self._pending.clear()
+
+    def stats(self):
+        """Return the cache size, hit and miss counts and hit rate"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._answers),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else None
+            }
+
+    def save(self):
+        """Write the stored answers and their embeddings to `path`"""
+        if not self.path:
+            return
+
+        with self._lock:
+            size = len(self._answers)
+            vectors = self._vectors[:size].copy() if size else np.zeros((0, 0), dtype=np.float32)
+            meta = {
+                "model": self.model_name,
+                "fingerprint": self.fingerprint,
+                "queries": list(self._queries),
+                "answers": list(self._answers)
+            }
+
+        # Vectors and metadata go in one file, written under a per-process temporary
+        # name, so concurrent savers (pre-fork workers) can only replace whole caches
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, vectors=vectors, meta=np.array(json.dumps(meta)))
+        os.replace(temp_path, self.path)
+
+    def _load(self):
+        """Load a saved cache if it was built with the same model and data"""
+        if not os.path.exists(self.path):
+            return
+
+        with np.load(self.path) as saved:
+            vectors = saved["vectors"]
+            meta = json.loads(saved["meta"].item())
+        if meta.get("model") != self.model_name or meta.get("fingerprint") != self.fingerprint:
+            return
+
+        answers = meta["answers"][:self.max_size]
+        if not answers or len(vectors) != len(meta["answers"]):
+            return
+
+        self._vectors = np.zeros((self.max_size, vectors.shape[1]), dtype=np.float32)
+        self._vectors[:len(answers)] = vectors[:len(answers)]
+        self._queries = meta["queries"][:len(answers)]
+        self._answers = answers
+        self._last_used = [0] * len(answers)
@@ -0,0 +1,74 @@
+import gzip
+import json
+import hashlib
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _accepted_encodings(accept_encoding):
+    """Return the content codings an Accept-Encoding header allows, with their q-values"""
+    encodings = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[coding.strip().lower()] = quality
+    return encodings
+
+
+class StaticResponse:
+    """A JSON payload serialized and compressed once, served with a strong ETag.
+
+    The body is encoded exactly like FastAPI's JSONResponse. gzip and, if the
+    brotli package is installed, br variants are precompressed when they are
+    smaller than the plain body; each variant has its own ETag, derived from
+    the content, so clients revalidating with If-None-Match get a 304.
+    """
+
+    def __init__(self, content, max_age=0):
+        body = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.cache_control = f"public, max-age={max_age}" if max_age else "no-cache"
+
+        # Variants in order of preference: (content coding, body, ETag)
+        self.variants = []
+        if brotli is not None:
+            self._add_variant("br", brotli.compress(body, quality=11), digest, len(body))
+        self._add_variant("gzip", gzip.compress(body, compresslevel=9, mtime=0), digest, len(body))
+        self.variants.append((None, body, f'"{digest}"'))
+        self.etags = {etag for _, _, etag in self.variants}
+
+    def _add_variant(self, coding, compressed, digest, plain_size):
+        if len(compressed) < plain_size:
+            self.variants.append((coding, compressed, f'"{digest}-{coding}"'))
+
+    def respond(self, request):
+        """Return the best variant for the request's Accept-Encoding, or a 304 if the client's copy is current"""
+        accepted = _accepted_encodings(request.headers.get("accept-encoding"))
+        for coding, body, etag in self.variants:
+            if coding is None or accepted.get(coding, accepted.get("*", 0)) > 0:
+                break
+
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            # If-None-Match uses the weak comparison, so W/ prefixes added by proxies don't matter
+            client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in client_etags or client_etags & self.etags:
+                return Response(status_code=304, headers=headers)
+
+        if coding:
+            headers["Content-Encoding"] = coding
+        return Response(content=body, media_type="application/json", headers=headers)
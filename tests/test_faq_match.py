@@ -0,0 +1,66 @@
+"""FAQ matching through the inverted index must pick exactly what the original full scan picked."""
+import re
+import copy
+import json
+import random
+import pathlib
+
+import pytest
+
+from chatbot_service import ChatbotService
+
+DATASET = json.loads((pathlib.Path(__file__).resolve().parent.parent / "dataset.json").read_text())
+
+
+def linear_faq_match(service, user_input):
+    """The original scan over every FAQ question"""
+    user_input = user_input.lower()
+    best_match_idx = -1
+    best_match_score = 0
+    for idx, question in enumerate(service.faq_questions):
+        if user_input in question or question in user_input:
+            words_in_user = set(re.findall(r'\b\w+\b', user_input))
+            words_in_question = set(re.findall(r'\b\w+\b', question))
+            common_words = words_in_user.intersection(words_in_question)
+            score = len(common_words) / max(len(words_in_user), len(words_in_question))
+            if score > best_match_score and score > 0.5:
+                best_match_score = score
+                best_match_idx = idx
+    return service.faq_answers[best_match_idx] if best_match_idx >= 0 else None
+
+
+def scaled_dataset(size):
+    """The dataset plus many near-identical FAQ entries, so several questions compete for each input"""
+    data = copy.deepcopy(DATASET)
+    for idx in range(size):
+        data["faq"].append({
+            "question": f"What is the support policy for plan {idx % 7} tier {idx}?",
+            "answer": f"Plan {idx} answer."
+        })
+    data["faq"].append({"question": "pricing", "answer": "Single-word question."})
+    return data
+
+
+def random_inputs(questions, count=3000, seed=0):
+    """Whole questions, word slices of them (substrings at exactly half overlap included) and padded variants"""
+    rng = random.Random(seed)
+    filler = ["please", "tell", "me", "the", "what", "is", "for", "?", "plan", "support", "policy"]
+    inputs = []
+    for _ in range(count):
+        words = rng.choice(questions).split()
+        start = rng.randint(0, len(words) - 1)
+        end = rng.randint(start + 1, len(words))
+        text = " ".join(words[start:end])
+        if rng.random() < 0.3:
+            text = " ".join(rng.sample(filler, rng.randint(1, 3))) + " " + text
+        if rng.random() < 0.3:
+            text = text + " " + " ".join(rng.sample(filler, rng.randint(1, 3)))
+        inputs.append(text.upper() if rng.random() < 0.1 else text)
+    return inputs
+
+
+@pytest.mark.parametrize("size", [0, 300])
+def test_faq_index_matches_linear_scan(size):
+    service = ChatbotService(None, scaled_dataset(size))
+    for user_input in random_inputs(service.faq_questions) + service.faq_questions + ["", "?", "pricing plans"]:
+        assert service._is_faq_match(user_input) == linear_faq_match(service, user_input), user_input
@@ -0,0 +1,76 @@
+"""The single-pass matchers must pick exactly what the original linear scans picked."""
+import re
+import json
+import random
+import pathlib
+
+import pytest
+
+from chatbot_service import (
+    ChatbotService, IRRELEVANT_TOPICS, PERSON_PATTERNS, PERSONAL_PATTERNS
+)
+
+DATASET = json.loads((pathlib.Path(__file__).resolve().parent.parent / "dataset.json").read_text())
+
+
+@pytest.fixture(scope="module")
+def service():
+    return ChatbotService(None, DATASET)
+
+
+def random_inputs(service, count=3000, seed=0):
+    """Mix keywords, topics, pattern fragments and filler words, in random case and order"""
+    rng = random.Random(seed)
+    fragments = list(service._build_keyword_responses()) + IRRELEVANT_TOPICS + [
+        "who is", "who's", "tell me about", "what do you know about", "how are you", "what's your name",
+        "who are you", "where are you", "your favourite", "what do you like", "monir", "sabina akter",
+        "gm", "game", "ceo", "cost", "?", "!", ",", "a", "the", "and", "sm technology", "bdcalling"
+    ]
+    inputs = []
+    for _ in range(count):
+        words = rng.sample(fragments, rng.randint(1, 5))
+        text = rng.choice([" ", "", "-"]).join(words)
+        inputs.append(text.upper() if rng.random() < 0.1 else text)
+    return inputs
+
+
+def linear_keyword_response(service, user_input):
+    user_input = user_input.lower()
+    for keyword, response in service._build_keyword_responses().items():
+        if keyword in user_input:
+            return response
+    return None
+
+
+def linear_search(patterns, text):
+    for idx, pattern in enumerate(patterns):
+        match = re.search(pattern, text)
+        if match:
+            return idx, match
+    return -1, None
+
+
+def test_keyword_automaton_matches_linear_scan(service):
+    for user_input in random_inputs(service):
+        assert service._extract_keyword_based_response(user_input) == linear_keyword_response(service, user_input)
+
+
+def test_topic_automaton_matches_linear_scan(service):
+    for user_input in random_inputs(service, seed=1):
+        lowered = user_input.lower()
+        expected = next((idx for idx, topic in enumerate(IRRELEVANT_TOPICS) if topic in lowered), -1)
+        assert service.topic_matcher.search(lowered) == expected
+
+
+@pytest.mark.parametrize("patterns", [PERSON_PATTERNS, PERSONAL_PATTERNS])
+def test_priority_matcher_matches_first_pattern(service, patterns):
+    matcher = service.person_matcher if patterns is PERSON_PATTERNS else service.personal_matcher
+    for user_input in random_inputs(service, seed=2):
+        lowered = user_input.lower()
+        idx, match = matcher.search(lowered)
+        expected_idx, expected = linear_search(patterns, lowered)
+        assert idx == expected_idx
+        if expected is not None:
+            assert match.span() == expected.span()
+            assert match.group(0) == expected.group(0)
+            assert match.groups() == expected.groups()
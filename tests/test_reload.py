@@ -0,0 +1,144 @@
+"""Hot reloads of dataset.json: what with_data rebuilds, and what the swap must leave behind."""
+import re
+import copy
+import json
+import zlib
+import pathlib
+
+import numpy as np
+import pytest
+
+import main
+from chatbot_service import ChatbotService
+from response_cache import ResponseCache
+from semantic_cache import SemanticAnswerCache
+
+DATASET = json.loads((pathlib.Path(__file__).resolve().parent.parent / "dataset.json").read_text())
+
+
+class WordHashEncoder:
+    """Stand-in for a SentenceTransformer: a normalized bag of hashed words"""
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False, batch_size=64):
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode("utf-8")) % 64] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    """A service as the lifespan hook builds it, reading dataset.json from tmp_path"""
+    (tmp_path / "dataset.json").write_text(json.dumps(DATASET))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RESPONSE_CACHE_GPT2", "1")
+
+    cache = main.build_response_cache()
+    service = ChatbotService(
+        None,
+        copy.deepcopy(DATASET),
+        response_cache=cache,
+        semantic_cache=SemanticAnswerCache(encoder=WordHashEncoder(), fingerprint=main.dataset_fingerprint(DATASET))
+    )
+    monkeypatch.setattr(main, "response_cache", cache)
+    monkeypatch.setattr(main, "chatbot_service", service)
+    monkeypatch.setattr(main, "json_data", service.data)
+    return tmp_path, service
+
+
+def test_old_service_answers_do_not_reach_the_new_caches(served):
+    tmp_path, old_service = served
+    question = "What makes a good software project?"
+
+    # A GPT-2 generation from the old context finishes only after the reload
+    old_service._generate_gpt2_response = lambda user_input: old_service._extract_answer(
+        "Answer: Answered from the old company description.", user_input
+    )
+
+    data = copy.deepcopy(DATASET)
+    data["company"]["description"] = "A rewritten company description."
+    (tmp_path / "dataset.json").write_text(json.dumps(data))
+    assert main.reload_dataset() == ["company"]
+    new_service = main.chatbot_service
+
+    assert old_service.get_gpt2_response(question) == "Answered from the old company description."
+    assert new_service.semantic_cache.get(question) is None
+    assert new_service.semantic_cache.stats()["size"] == 0
+    assert new_service.semantic_cache.fingerprint == main.dataset_fingerprint(data)
+    assert new_service.response_cache.get(question) is None
+    assert main.response_cache is new_service.response_cache
+
+    # The old service's own caches still work for the requests finishing on it
+    assert old_service.semantic_cache.get(question) == "Answered from the old company description."
+    assert old_service.response_cache.get(question) == ("gpt2", "Answered from the old company description.")
+
+
+def test_reload_shares_the_encoder_with_the_new_semantic_cache(served):
+    tmp_path, old_service = served
+    data = copy.deepcopy(DATASET)
+    data["faq"] = data["faq"][1:]
+    (tmp_path / "dataset.json").write_text(json.dumps(data))
+
+    assert main.reload_dataset() == ["faq"]
+    assert main.chatbot_service.semantic_cache is not old_service.semantic_cache
+    assert main.chatbot_service.semantic_cache.encoder is old_service.semantic_cache.encoder
+    assert isinstance(main.chatbot_service.response_cache, ResponseCache)
+
+
+def test_with_data_returns_the_service_itself_when_nothing_changed():
+    service = ChatbotService(None, copy.deepcopy(DATASET))
+    assert service.with_data(copy.deepcopy(DATASET)) == (service, set())
+
+
+def test_with_data_rebuilds_only_what_the_changed_sections_feed():
+    service = ChatbotService(None, copy.deepcopy(DATASET), max_batch_size=4)
+
+    data = copy.deepcopy(DATASET)
+    data["faq"][0]["answer"] = "A new answer."
+    faq_copy, changed = service.with_data(data)
+    assert changed == {"faq"}
+    assert faq_copy is not service and faq_copy.data is data and service.data == DATASET
+    assert faq_copy.faq_answers[0] == "A new answer." and service.faq_answers[0] != "A new answer."
+    assert faq_copy.keyword_matcher is service.keyword_matcher
+    assert faq_copy.context is service.context
+
+    data = copy.deepcopy(DATASET)
+    data["tech_stack"].append("Elixir")
+    keyword_copy, changed = service.with_data(data)
+    assert changed == {"tech_stack"}
+    assert keyword_copy.faq_answers is service.faq_answers
+    assert keyword_copy.keyword_matcher is not service.keyword_matcher
+    assert "Elixir" in keyword_copy.context and "Elixir" not in service.context
+    assert keyword_copy.get_fast_response("Do you work with Elixir?")
+    assert service.get_fast_response("Do you work with Elixir?") != keyword_copy.get_fast_response("Do you work with Elixir?")
+
+    data = copy.deepcopy(DATASET)
+    data["pricing"] = dict(data["pricing"], consulting="Contact us.")
+    context_copy, changed = service.with_data(data)
+    assert changed == {"pricing"}
+    assert context_copy.keyword_matcher is service.keyword_matcher
+    assert context_copy.context != service.context
+
+
+def test_with_data_gives_the_copy_its_own_batcher():
+    service = ChatbotService(None, copy.deepcopy(DATASET), max_batch_size=4, batch_wait=0.02)
+    data = copy.deepcopy(DATASET)
+    data["faq"] = data["faq"][1:]
+    updated, _ = service.with_data(data)
+
+    assert updated.batcher is not service.batcher
+    assert updated.batcher.generate_batch.__self__ is updated
+    assert service.batcher.generate_batch.__self__ is service
+    assert (updated.batcher.max_batch_size, updated.batcher.max_wait) == (4, 0.02)
+
+
+def test_reload_rejects_a_dataset_the_service_cannot_be_built_from(served):
+    tmp_path, service = served
+    data = copy.deepcopy(DATASET)
+    del data["company"]["management"]
+    (tmp_path / "dataset.json").write_text(json.dumps(data))
+
+    with pytest.raises(ValueError, match="management"):
+        main.reload_dataset()
+    assert main.chatbot_service is service
@@ -0,0 +1,96 @@
+"""Content negotiation and revalidation of the precomputed static payloads."""
+import gzip
+import copy
+import json
+import pathlib
+from types import SimpleNamespace
+
+import pytest
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+
+import main
+from static_responses import StaticResponse
+
+DATASET = json.loads((pathlib.Path(__file__).resolve().parent.parent / "dataset.json").read_text())
+
+
+def request(**headers):
+    return SimpleNamespace(headers=Headers({name.replace("_", "-"): value for name, value in headers.items()}))
+
+
+@pytest.fixture
+def faq():
+    return StaticResponse({"faq": DATASET["faq"]})
+
+
+def test_plain_body_matches_json_response(faq):
+    response = faq.respond(request())
+    assert response.status_code == 200
+    assert response.body == JSONResponse({"faq": DATASET["faq"]}).body
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["cache-control"] == "no-cache"
+
+
+@pytest.mark.parametrize("accept_encoding", ["gzip", "GZIP", "deflate, gzip;q=0.5", " gzip ; q=1.0 ", "*;q=0, gzip"])
+def test_gzip_is_served_when_accepted(faq, accept_encoding):
+    response = faq.respond(request(accept_encoding=f"br;q=0, {accept_encoding}"))
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"].endswith('-gzip"')
+    assert gzip.decompress(response.body) == faq.respond(request()).body
+
+
+@pytest.mark.parametrize("accept_encoding", ["gzip;q=0", "gzip;q=0.0, identity", "deflate", "*;q=0", "gzip;q=bogus", ""])
+def test_plain_body_is_served_when_no_variant_is_accepted(faq, accept_encoding):
+    response = faq.respond(request(accept_encoding=accept_encoding))
+    assert "content-encoding" not in response.headers
+    assert response.body == JSONResponse({"faq": DATASET["faq"]}).body
+
+
+def test_wildcard_accepts_the_preferred_variant(faq):
+    preferred = faq.variants[0][0]
+    response = faq.respond(request(accept_encoding="*"))
+    assert response.headers["content-encoding"] == preferred
+    assert faq.respond(request(accept_encoding=f"{preferred};q=0, *")).headers.get("content-encoding") != preferred
+
+
+def test_small_payloads_have_no_compressed_variant():
+    root = StaticResponse({"message": "hi"})
+    assert [coding for coding, _, _ in root.variants] == [None]
+    assert "content-encoding" not in root.respond(request(accept_encoding="gzip")).headers
+
+
+@pytest.mark.parametrize("accept_encoding", [None, "gzip"])
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"stale", {etag}', "*"])
+def test_current_etag_gets_not_modified(faq, accept_encoding, if_none_match):
+    headers = {"accept_encoding": accept_encoding} if accept_encoding else {}
+    etag = faq.respond(request(**headers)).headers["etag"]
+
+    response = faq.respond(request(if_none_match=if_none_match.format(etag=etag), **headers))
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == etag
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_etags_of_other_variants_also_revalidate(faq):
+    # A cache holding the gzip copy may revalidate for a client that gets the plain one
+    gzip_etag = faq.respond(request(accept_encoding="gzip")).headers["etag"]
+    assert faq.respond(request(if_none_match=gzip_etag)).status_code == 304
+
+
+def test_faq_reload_changes_the_etag(monkeypatch):
+    monkeypatch.setattr(main, "static_responses", {})
+    main.build_static_responses(DATASET)
+    old_etag = main.static_responses["/faq"].respond(request()).headers["etag"]
+    root_etag = main.static_responses["/"].respond(request()).headers["etag"]
+
+    data = copy.deepcopy(DATASET)
+    data["faq"][0]["answer"] = "A new answer."
+    main.build_static_responses(data)
+    response = main.static_responses["/faq"].respond(request(if_none_match=old_etag))
+    assert response.status_code == 200
+    assert response.headers["etag"] != old_etag
+    assert json.loads(response.body)["faq"][0]["answer"] == "A new answer."
+    assert main.static_responses["/"].respond(request()).headers["etag"] == root_etag
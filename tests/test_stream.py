@@ -0,0 +1,86 @@
+"""Streamed GPT-2 tokens must never show text the answer filters go on to reject."""
+import json
+import queue
+import pathlib
+from concurrent.futures import Future
+
+from chatbot_service import ChatbotService, MAX_ANSWER_LENGTH, MIN_ANSWER_LENGTH
+
+DATASET = json.loads((pathlib.Path(__file__).resolve().parent.parent / "dataset.json").read_text())
+PROMPT_SUFFIX = "Question: What do you build?\nAnswer:"
+
+
+class TextTokenizer:
+    """Stand-in tokenizer whose "token ids" are the text itself"""
+
+    def decode(self, ids, skip_special_tokens=True):
+        return ids
+
+
+def stream(chunks):
+    """Feed the chunks through the stream event iterator; returns (streamed text, final event)"""
+    service = ChatbotService(None, DATASET)
+    service.tokenizer = TextTokenizer()
+
+    # The streamer skips the prompt, while the decoded output still holds its question suffix
+    future = Future()
+    future.set_result([PROMPT_SUFFIX + "".join(chunks)])
+    events = list(service._iter_stream_events("What do you build?", iter(chunks), future, 0))
+
+    assert all("token" in event for event in events[:-1])
+    assert events[-1]["done"]
+    return "".join(event["token"] for event in events[:-1]), events[-1]
+
+
+def test_accepted_answer_is_streamed_whole():
+    streamed, final = stream([" We build", " websites and mobile", " apps.", "\nQuestion: more"])
+    assert streamed == "We build websites and mobile apps."
+    assert final["response"] == streamed
+    assert not final["replaced"]
+
+
+def test_red_flag_split_across_chunks_is_never_streamed():
+    streamed, final = stream([" We build apps and I", " am happy", " to help you."])
+    assert "I" not in streamed
+    assert streamed == "We build apps and "
+    assert final["response"].startswith("I'm sorry")
+    assert final["replaced"]
+
+
+def test_answer_marker_split_across_chunks_is_never_streamed():
+    streamed, final = stream([" We build mobile apps for clients.", " Ans", "wer: something else"])
+    assert "Ans" not in streamed
+    assert final["response"] == "We build mobile apps for clients."
+    assert streamed.rstrip() == final["response"]
+    assert not final["replaced"]
+
+
+def test_too_short_answer_is_never_streamed():
+    answer = "Yes sir."
+    assert len(answer) < MIN_ANSWER_LENGTH
+    streamed, final = stream([" Yes", " sir.", "\n"])
+    assert streamed == ""
+    assert final["response"].startswith("I'm sorry")
+    assert not final["replaced"]
+
+
+def test_too_long_answer_is_replaced():
+    chunks = [" Our team delivers websites and mobile applications for clients around the world."] * 4
+    assert len("".join(chunks).strip()) > MAX_ANSWER_LENGTH
+    streamed, final = stream(chunks)
+    assert 0 < len(streamed) <= MAX_ANSWER_LENGTH
+    assert final["response"].startswith("I'm sorry")
+    assert final["replaced"]
+
+
+def test_stalled_stream_ends_with_the_timeout_answer():
+    def stalled():
+        yield " We build websites and"
+        raise queue.Empty
+
+    service = ChatbotService(None, DATASET)
+    service.tokenizer = TextTokenizer()
+    events = list(service._iter_stream_events("What do you build?", stalled(), Future(), 0))
+    assert events[:-1] == [{"token": "We build websites and"}]
+    assert events[-1]["done"] and "took too long" in events[-1]["response"]
+    assert events[-1]["replaced"]